@@ -43,6 +43,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.StaticFilesMiddleware',
+    'shop.middleware.CompressionMiddleware',
+    'shop.middleware.ReplicaPinningMiddleware',
+    'shop.middleware.QueryInstrumentationMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,6 +87,60 @@ DATABASES = {
     }
 }
 
+DATABASE_ROUTERS = ['shop.routers.PrimaryReplicaRouter']
+
+# Read-only aliases in DATABASES that catalog and history reads are spread over.
+SHOP_DATABASE_REPLICAS = []
+
+# How long a client that wrote keeps reading from the primary.
+SHOP_REPLICA_PIN_SECONDS = 10
+
+# PRAGMAs run on every new SQLite connection (see settings_production.py).
+SHOP_SQLITE_PRAGMAS = {}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shop',
+    }
+}
+
+
+# Sessions and authentication
+
+# Sessions are read from the cache and written through to the database. A
+# per-process cache is only safe with one process; settings_production.py
+# picks the engine from the cache it is given.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# ModelBackend stays listed so sessions saved with its path remain valid.
+AUTHENTICATION_BACKENDS = ['accounts.backends.CachedModelBackend', 'django.contrib.auth.backends.ModelBackend']
+
+# Seconds the user behind a session stays cached; 0 loads it on every request.
+# Off here: the local-memory cache is per process, so other workers would not
+# see a user being deactivated. settings_production turns it on with Redis.
+SHOP_USER_CACHE_TIMEOUT = 0
+
+# Password attempts allowed per sliding window before the views answer 429
+# without hashing; reaching the address limits locks that address out.
+SHOP_LOGIN_WINDOW = 300
+
+SHOP_LOGIN_USERNAME_LIMIT = 5
+
+SHOP_LOGIN_IP_LIMIT = 30
+
+SHOP_REGISTER_IP_LIMIT = 10
+
+SHOP_LOGIN_LOCKOUT = 900
+
+# Request header holding the client address when behind a reverse proxy,
+# e.g. 'HTTP_X_FORWARDED_FOR'; REMOTE_ADDR is used when unset.
+SHOP_CLIENT_IP_HEADER = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -120,7 +178,94 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Shop
+
+SHOP_PAGE_SIZE = 25
+
+SHOP_MAX_PAGE_SIZE = 100
+
+SHOP_COMMENTS_PAGE_SIZE = 20
+
+SHOP_SEARCH_MAX_RESULTS = 1000
+
+# Per-process LRU of ranked search result ids; product and brand writes invalidate it.
+SHOP_SEARCH_CACHE_SIZE = 256
+
+SHOP_SEARCH_CACHE_TIMEOUT = 300
+
+# Orders fetched per query (with their lines prefetched) by the order export;
+# at most shop.exports.MAX_CHUNK_SIZE.
+SHOP_EXPORT_CHUNK_SIZE = 900
+
+# Seconds before the last run's high-water mark that manage.py rollup_sales re-reads, for late commits.
+SHOP_ROLLUP_LAG = 300
+
+# Serve STATIC_ROOT (collectstatic output) from the app with far-future cache headers.
+SHOP_SERVE_STATIC = False
+
+# Link each page's stylesheets as the one bundle collectstatic built for it.
+SHOP_BUNDLE_CSS = False
+
+# Compress responses in CompressionMiddleware; encodings in order of preference,
+# br and zstd only when the brotli / zstandard packages are installed.
+SHOP_COMPRESS_RESPONSES = False
+
+SHOP_COMPRESS_ENCODINGS = ('br', 'zstd', 'gzip')
+
+# Smaller bodies are sent as is; the saving would not cover the CPU and headers.
+SHOP_COMPRESS_MIN_SIZE = 1024
+
+SHOP_COMPRESS_TYPES = ('text/html', 'text/plain', 'text/css', 'text/csv', 'application/json',
+                       'application/x-ndjson', 'application/javascript', 'image/svg+xml')
+
+# Send pages that carry a CSRF token uncompressed (BREACH); tokens are already masked per response.
+SHOP_COMPRESS_SKIP_CSRF = False
+
+# Per-request SQL accounting (query count/time headers, N+1 warnings).
+SHOP_SQL_INSTRUMENTATION = False
+
+SHOP_NPLUSONE_THRESHOLD = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'shop.sql': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+# Lifetime of cached catalog pages and fragments; writes invalidate them early.
+SHOP_CATALOG_CACHE_TIMEOUT = 600
+
+# Serve the catalog read views (lists, detail, search) with the async views; for ASGI.
+SHOP_ASYNC_VIEWS = False
+
+# Lower edges of the price-band facets; the last band is open-ended.
+SHOP_PRICE_BANDS = (0, 25, 50, 100, 250)
+
+# Seconds facet counts stay cached; product and brand writes re-aggregate them sooner.
+SHOP_FACET_CACHE_TIMEOUT = 3600
+
+# In-process prefix index behind the search box suggestions.
+SHOP_AUTOCOMPLETE_MAX_ENTRIES = 200000
+
+SHOP_AUTOCOMPLETE_LIMIT = 8
+
+# Seconds before a process rebuilds its index to pick up other processes' writes.
+SHOP_AUTOCOMPLETE_REFRESH = 300
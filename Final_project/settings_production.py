@@ -0,0 +1,193 @@
+"""
+Production profile, selected with
+``DJANGO_SETTINGS_MODULE=Final_project.settings_production``.
+
+Everything deployment specific comes from the environment:
+
+    DJANGO_SECRET_KEY        required
+    DJANGO_ALLOWED_HOSTS     comma separated, default "localhost"
+    DJANGO_DEBUG             default off
+    DB_ENGINE                "sqlite" (default) or "postgresql"
+    DB_NAME                  SQLite file path or PostgreSQL database name
+    DB_USER, DB_PASSWORD, DB_HOST, DB_PORT
+    DB_CONN_MAX_AGE          seconds to keep connections open, default 600
+    DB_POOL                  PostgreSQL connection pool (needs Django 5.1+),
+                             DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE size it
+    DB_PGBOUNCER             PostgreSQL behind PgBouncer in transaction mode
+    DB_REPLICAS              comma separated read replicas: PostgreSQL hosts, or
+                             SQLite files kept current with ``manage.py sync_replicas``
+    REDIS_URL                shared cache for all workers, e.g. redis://localhost:6379/0;
+                             without it each process keeps its own in-memory cache
+    SESSION_BACKEND          "db", "cached_db" or "signed_cookies"; defaults to
+                             "cached_db" with REDIS_URL and "db" without
+    SHOP_USER_CACHE_TIMEOUT  seconds a session's user stays cached, default 300
+                             with REDIS_URL and 0 (off) without
+    STATIC_ROOT              collectstatic target, default "staticfiles" next to manage.py
+    SHOP_SERVE_STATIC        serve STATIC_ROOT from the app, default on; turn off when
+                             a web server or CDN serves it
+    SHOP_BUNDLE_CSS          link each page's CSS as one bundle, default on
+    SHOP_COMPRESS_RESPONSES  compress HTML/JSON/CSV responses, default on
+    SHOP_COMPRESS_SKIP_CSRF  leave pages carrying a CSRF token uncompressed
+    SHOP_ASYNC_VIEWS         serve the catalog read views async (for ASGI servers)
+    SHOP_LOGIN_USERNAME_LIMIT, SHOP_LOGIN_IP_LIMIT, SHOP_REGISTER_IP_LIMIT
+                             password attempts per SHOP_LOGIN_WINDOW seconds
+    SHOP_LOGIN_LOCKOUT       seconds a throttled address waits, default 900
+    SHOP_CLIENT_IP_HEADER    header with the client address set by the reverse
+                             proxy, e.g. HTTP_X_FORWARDED_FOR
+    SQLITE_BUSY_TIMEOUT      milliseconds to wait on a locked database, default 5000
+    SQLITE_CACHE_SIZE        page cache in KiB, default 65536
+    SQLITE_MMAP_SIZE         bytes of memory mapped I/O, default 268435456
+"""
+import os
+
+import django
+from django.core.exceptions import ImproperlyConfigured
+
+from Final_project.settings import *  # noqa: F401,F403
+from Final_project.settings import (
+    BASE_DIR, SHOP_LOGIN_IP_LIMIT, SHOP_LOGIN_LOCKOUT, SHOP_LOGIN_USERNAME_LIMIT, SHOP_LOGIN_WINDOW,
+    SHOP_REGISTER_IP_LIMIT,
+)
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ImproperlyConfigured(f'{name} must be an integer, got {value!r}')
+
+
+def env_list(name, default=''):
+    return [item.strip() for item in os.environ.get(name, default).split(',') if item.strip()]
+
+
+try:
+    SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+except KeyError:
+    raise ImproperlyConfigured('Set DJANGO_SECRET_KEY to use the production settings.')
+
+DEBUG = env_bool('DJANGO_DEBUG')
+
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS', 'localhost')
+
+SHOP_ASYNC_VIEWS = env_bool('SHOP_ASYNC_VIEWS')
+
+# collectstatic writes hashed names, bundles and .gz/.br copies; run it on
+# every deploy, the manifest is required to render pages.
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'shop.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+SHOP_SERVE_STATIC = env_bool('SHOP_SERVE_STATIC', True)
+SHOP_BUNDLE_CSS = env_bool('SHOP_BUNDLE_CSS', True)
+
+SHOP_COMPRESS_RESPONSES = env_bool('SHOP_COMPRESS_RESPONSES', True)
+SHOP_COMPRESS_SKIP_CSRF = env_bool('SHOP_COMPRESS_SKIP_CSRF')
+
+# Cached sessions and users must be invalidated in every worker, so they are
+# only on by default when the cache is shared.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    # No server-side state at all, but a session cannot be revoked before it expires.
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'cached_db' if REDIS_URL else 'db')
+try:
+    SESSION_ENGINE = SESSION_ENGINES[SESSION_BACKEND]
+except KeyError:
+    raise ImproperlyConfigured(f'Unsupported SESSION_BACKEND {SESSION_BACKEND!r}, use one of {", ".join(SESSION_ENGINES)}.')
+
+SHOP_USER_CACHE_TIMEOUT = env_int('SHOP_USER_CACHE_TIMEOUT', 300 if REDIS_URL else 0)
+
+SHOP_LOGIN_WINDOW = env_int('SHOP_LOGIN_WINDOW', SHOP_LOGIN_WINDOW)
+SHOP_LOGIN_USERNAME_LIMIT = env_int('SHOP_LOGIN_USERNAME_LIMIT', SHOP_LOGIN_USERNAME_LIMIT)
+SHOP_LOGIN_IP_LIMIT = env_int('SHOP_LOGIN_IP_LIMIT', SHOP_LOGIN_IP_LIMIT)
+SHOP_REGISTER_IP_LIMIT = env_int('SHOP_REGISTER_IP_LIMIT', SHOP_REGISTER_IP_LIMIT)
+SHOP_LOGIN_LOCKOUT = env_int('SHOP_LOGIN_LOCKOUT', SHOP_LOGIN_LOCKOUT)
+SHOP_CLIENT_IP_HEADER = os.environ.get('SHOP_CLIENT_IP_HEADER') or None
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+CONN_MAX_AGE = env_int('DB_CONN_MAX_AGE', 600)
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DB_NAME', 'shop'),
+            'USER': os.environ.get('DB_USER', ''),
+            'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+            'HOST': os.environ.get('DB_HOST', ''),
+            'PORT': os.environ.get('DB_PORT', ''),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # Server-side cursors do not survive PgBouncer's transaction pooling.
+            'DISABLE_SERVER_SIDE_CURSORS': env_bool('DB_PGBOUNCER'),
+            'OPTIONS': {},
+        }
+    }
+    if env_bool('DB_POOL'):
+        if django.VERSION < (5, 1):
+            raise ImproperlyConfigured(
+                'DB_POOL needs Django 5.1+; on older versions point DB_HOST at PgBouncer and set DB_PGBOUNCER=1.'
+            )
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': env_int('DB_POOL_MIN_SIZE', 2),
+            'max_size': env_int('DB_POOL_MAX_SIZE', 20),
+        }
+        # The pool owns connection lifetime; persistent connections must be off.
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+elif DB_ENGINE == 'sqlite':
+    busy_timeout = env_int('SQLITE_BUSY_TIMEOUT', 5000)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DB_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {'timeout': busy_timeout / 1000},
+        }
+    }
+    # Applied to every new connection by shop.signals.configure_sqlite.
+    SHOP_SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': busy_timeout,
+        'cache_size': -env_int('SQLITE_CACHE_SIZE', 65536),
+        'mmap_size': env_int('SQLITE_MMAP_SIZE', 268435456),
+        'temp_store': 'MEMORY',
+    }
+else:
+    raise ImproperlyConfigured(f'Unsupported DB_ENGINE {DB_ENGINE!r}, use "sqlite" or "postgresql".')
+
+# Each replica is a copy of the primary's settings pointing elsewhere; tests
+# mirror them onto the test primary instead of creating separate databases.
+SHOP_DATABASE_REPLICAS = []
+for number, location in enumerate(env_list('DB_REPLICAS'), start=1):
+    alias = f'replica_{number}'
+    replica = {**DATABASES['default'], 'OPTIONS': dict(DATABASES['default']['OPTIONS']),
+               'TEST': {'MIRROR': 'default'}}
+    replica['HOST' if DB_ENGINE == 'postgresql' else 'NAME'] = location
+    DATABASES[alias] = replica
+    SHOP_DATABASE_REPLICAS.append(alias)
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def cached_fields(model):
+    # The password hash stays out of the shared cache.
+    return [field.attname for field in model._meta.concrete_fields if field.attname != 'password']
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend that keeps the user behind each authenticated session in the
+    cache for SHOP_USER_CACHE_TIMEOUT seconds, so AuthenticationMiddleware does
+    not query auth_user on every request. Saving or deleting a user and
+    logging out drop the entry (accounts.signals), which also makes a password
+    change end the user's other sessions right away.
+
+    Only the user's fields and session hash are cached, never the password
+    hash: a cached user loads its password from the database on first use.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        user = super().authenticate(request, username=username, password=password, **kwargs)
+        if user is None and username is not None:
+            # ModelBackend, listed after this one for sessions that predate
+            # it, would only hash the same wrong password a second time.
+            raise PermissionDenied
+        return user
+
+    def get_user(self, user_id):
+        timeout = settings.SHOP_USER_CACHE_TIMEOUT
+        if not timeout:
+            return super().get_user(user_id)
+        UserModel = get_user_model()
+        fields = cached_fields(UserModel)
+        key = user_cache_key(user_id)
+        cached = cache.get(key)
+        if cached is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                cache.set(key, (user._state.db, [getattr(user, name) for name in fields],
+                                user.get_session_auth_hash()), timeout)
+            return user
+        db, values, session_auth_hash = cached
+        # The password is a deferred field, fetched if anything reads it.
+        user = UserModel.from_db(db, fields, values)
+        user.get_session_auth_hash = lambda: session_auth_hash
+        return user
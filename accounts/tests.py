@@ -1,9 +1,16 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import pytest
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import Client
 from django.urls import reverse
 
+from accounts import views
+from accounts.backends import user_cache_key
+from accounts.throttling import SlidingWindowLimiter
+
 
 @pytest.mark.django_db
 def test_create_user_view_get():
@@ -67,3 +74,174 @@ def test_logout_view():
     assert response.url == reverse('base')
     response = client.get(reverse('base'))
     assert not response.wsgi_request.user.is_authenticated
+
+
+@pytest.mark.django_db
+def test_session_user_is_cached_until_it_changes(settings, django_assert_num_queries):
+    settings.SHOP_USER_CACHE_TIMEOUT = 300
+    user = User.objects.create_user(username='testuser', password='password123')
+    client = Client()
+    client.login(username='testuser', password='password123')
+    other = Client()
+    other.login(username='testuser', password='password123')
+    client.get(reverse('base'))
+    # Session and user both come from the cache.
+    with django_assert_num_queries(0):
+        response = client.get(reverse('base'))
+    assert response.wsgi_request.user == user
+
+    # A password change reaches the cached user, which ends the other sessions.
+    user.set_password('new-password')
+    user.save()
+    assert not other.get(reverse('base')).wsgi_request.user.is_authenticated
+
+    client.login(username='testuser', password='new-password')
+    client.get(reverse('base'))
+    client.get(reverse('logout'))
+    assert cache.get(user_cache_key(user.pk)) is None
+    assert not client.get(reverse('base')).wsgi_request.user.is_authenticated
+
+
+@pytest.mark.django_db
+def test_cached_user_leaves_the_password_out(settings, django_assert_num_queries):
+    settings.SHOP_USER_CACHE_TIMEOUT = 300
+    user = User.objects.create_user(username='testuser', password='password123')
+    client = Client()
+    client.login(username='testuser', password='password123')
+    client.get(reverse('base'))
+    assert user.password not in repr(cache.get(user_cache_key(user.pk)))
+    cached = client.get(reverse('base')).wsgi_request.user
+    assert cached.username == 'testuser'
+    # Anything that needs the hash loads it from the database.
+    with django_assert_num_queries(1):
+        assert cached.check_password('password123')
+
+
+@pytest.mark.django_db
+def test_sessions_from_model_backend_stay_logged_in():
+    User.objects.create_user(username='testuser', password='password123')
+    client = Client()
+    client.login(username='testuser', password='password123')
+    session = client.session
+    session['_auth_user_backend'] = 'django.contrib.auth.backends.ModelBackend'
+    session.save()
+    assert client.get(reverse('base')).wsgi_request.user.is_authenticated
+
+
+@pytest.mark.django_db
+def test_failed_login_hashes_once(monkeypatch):
+    User.objects.create_user(username='testuser', password='password123')
+    checked = []
+    original = User.check_password
+    monkeypatch.setattr(User, 'check_password', lambda self, raw: checked.append(raw) or original(self, raw))
+    assert authenticate(username='testuser', password='wrong') is None
+    assert checked == ['wrong']
+
+
+@pytest.mark.django_db
+def test_user_cache_can_be_disabled(settings, django_assert_num_queries):
+    settings.SHOP_USER_CACHE_TIMEOUT = 0
+    User.objects.create_user(username='testuser', password='password123')
+    client = Client()
+    client.login(username='testuser', password='password123')
+    client.get(reverse('base'))
+    with django_assert_num_queries(1):
+        client.get(reverse('base'))
+
+
+def test_sliding_window_limiter():
+    limiter = SlidingWindowLimiter('test', limit=4, window=100)
+    for now in (10, 20, 30, 40):
+        assert limiter.retry_after('someone', now) == 0
+        limiter.hit('someone', now)
+    assert limiter.retry_after('someone', 50) == 50
+    assert limiter.retry_after('someone else', 50) == 0
+    # Halfway into the next window half of the previous count still applies.
+    assert limiter.retry_after('someone', 150) == 0
+    limiter.hit('someone', 150)
+    limiter.hit('someone', 150)
+    assert limiter.retry_after('someone', 150) == 50
+    assert limiter.retry_after('someone', 260) == 0
+    limiter.reset('someone', 150)
+    assert limiter.retry_after('someone', 150) == 0
+
+
+@pytest.mark.django_db
+def test_login_throttled_before_hashing(settings, monkeypatch):
+    settings.SHOP_LOGIN_USERNAME_LIMIT = 3
+    settings.SHOP_LOGIN_IP_LIMIT = 5
+    User.objects.create_user(username='testuser', password='password123')
+    hashed = []
+    original = views.authenticate
+    monkeypatch.setattr(views, 'authenticate', lambda **kwargs: hashed.append(1) or original(**kwargs))
+    client = Client()
+    url = reverse('login')
+    for _ in range(3):
+        assert client.post(url, {'username': 'testuser', 'password': 'wrong'}).status_code == 302
+    response = client.post(url, {'username': 'TestUser', 'password': 'password123'})
+    assert response.status_code == 429
+    # Usernames are not locked out, only held to the sliding window.
+    assert 0 < int(response['Retry-After']) <= settings.SHOP_LOGIN_WINDOW
+    assert 'Too many attempts' in response.content.decode()
+    assert len(hashed) == 3
+
+    # Other accounts are still reachable until the address runs out too.
+    assert client.post(url, {'username': 'other', 'password': 'x'}).status_code == 302
+    assert client.post(url, {'username': 'testuser2', 'password': 'x'}).status_code == 302
+    response = client.post(url, {'username': 'testuser3', 'password': 'x'})
+    assert response.status_code == 429
+    assert settings.SHOP_LOGIN_WINDOW < int(response['Retry-After']) <= settings.SHOP_LOGIN_LOCKOUT
+    assert len(hashed) == 5
+    other_address = Client(REMOTE_ADDR='10.0.0.2')
+    assert other_address.post(url, {'username': 'testuser3', 'password': 'x'}).status_code == 302
+
+    # Behind a proxy every request comes from the proxy; the header tells clients apart.
+    settings.SHOP_CLIENT_IP_HEADER = 'HTTP_X_FORWARDED_FOR'
+    proxied = Client(HTTP_X_FORWARDED_FOR='198.51.100.1, 10.0.0.3')
+    assert proxied.post(url, {'username': 'testuser3', 'password': 'x'}).status_code == 302
+
+
+def test_sliding_window_limiter_counts_before_deciding():
+    limiter = SlidingWindowLimiter('test', limit=3, window=100)
+    with ThreadPoolExecutor(8) as pool:
+        waits = list(pool.map(lambda _: limiter.hit('someone', 10), range(8)))
+    # However the hits interleave, only the first three get through.
+    assert sorted(waits) == [0, 0, 0, 90, 90, 90, 90, 90]
+    limiter.release('someone', 10)
+    assert limiter.retry_after('someone', 10) == 90
+
+
+@pytest.mark.django_db
+def test_successful_logins_do_not_count_against_the_address(settings):
+    settings.SHOP_LOGIN_IP_LIMIT = 3
+    User.objects.create_user(username='testuser', password='password123')
+    client = Client()
+    url = reverse('login')
+    for _ in range(5):
+        assert client.post(url, {'username': 'testuser', 'password': 'password123'}).url == reverse('base')
+    for _ in range(3):
+        assert client.post(url, {'username': 'testuser', 'password': 'wrong'}).status_code == 302
+    assert client.post(url, {'username': 'testuser', 'password': 'password123'}).status_code == 429
+
+
+@pytest.mark.django_db
+def test_successful_login_resets_username_limit(settings):
+    settings.SHOP_LOGIN_USERNAME_LIMIT = 2
+    User.objects.create_user(username='testuser', password='password123')
+    client = Client()
+    url = reverse('login')
+    client.post(url, {'username': 'testuser', 'password': 'wrong'})
+    assert client.post(url, {'username': 'testuser', 'password': 'password123'}).url == reverse('base')
+    assert client.post(url, {'username': 'testuser', 'password': 'wrong'}).status_code == 302
+
+
+@pytest.mark.django_db
+def test_register_throttled(settings):
+    settings.SHOP_REGISTER_IP_LIMIT = 2
+    client = Client()
+    url = reverse('register')
+    for name in ('first', 'second'):
+        client.post(url, {'username': name, 'password': 'pw', 'password2': 'pw'})
+    response = client.post(url, {'username': 'third', 'password': 'pw', 'password2': 'pw'})
+    assert response.status_code == 429
+    assert not User.objects.filter(username='third').exists()
@@ -0,0 +1,141 @@
+"""
+Cache-backed rate limiting for the password views. Hashing a password costs
+tens of milliseconds of CPU, so attempts over the limit are turned away
+before authenticate() or set_password() ever run.
+"""
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.shortcuts import render
+
+
+class SlidingWindowLimiter:
+    """
+    At most ``limit`` hits per ``window`` seconds for each identity, counted
+    in the cache so all workers share the tally. The sliding window is
+    approximated from two fixed windows: the current count plus the previous
+    one weighted by how much of it the sliding window still covers, which
+    takes two cache keys per identity instead of one entry per hit. Reaching
+    the limit locks the identity out for ``lockout`` seconds.
+
+    hit() counts the attempt before deciding on it, from the count the cache
+    returns, so concurrent attempts cannot all pass a check made before any
+    of them was counted.
+    """
+
+    def __init__(self, scope, limit, window, lockout=0):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+        self.lockout = lockout
+
+    def key(self, identity, suffix):
+        # Usernames may hold characters some cache backends reject in keys.
+        digest = hashlib.sha256(str(identity).casefold().encode()).hexdigest()[:32]
+        return f'throttle:{self.scope}:{digest}:{suffix}'
+
+    def keys(self, identity, now):
+        bucket = int(now // self.window)
+        return self.key(identity, 'lock'), self.key(identity, bucket), self.key(identity, bucket - 1)
+
+    def retry_after(self, identity, now=None):
+        """Seconds until ``identity`` may try again; 0 when it may now."""
+        now = time.time() if now is None else now
+        lock, current, previous = self.keys(identity, now)
+        values = cache.get_many([lock, current, previous])
+        if values.get(lock, 0) > now:
+            return math.ceil(values[lock] - now)
+        overlap = 1 - (now % self.window) / self.window
+        if values.get(current, 0) + values.get(previous, 0) * overlap < self.limit:
+            return 0
+        return math.ceil(self.window * overlap) or 1
+
+    def hit(self, identity, now=None):
+        """Count an attempt and return the seconds it must wait; 0 lets it through."""
+        now = time.time() if now is None else now
+        lock, current, previous = self.keys(identity, now)
+        cache.add(current, 0, self.window * 2)
+        try:
+            count = cache.incr(current)
+        except ValueError:
+            # Expired between add() and incr().
+            cache.set(current, 1, self.window * 2)
+            count = 1
+        values = cache.get_many([lock, previous])
+        if values.get(lock, 0) > now:
+            return math.ceil(values[lock] - now)
+        overlap = 1 - (now % self.window) / self.window
+        total = count + values.get(previous, 0) * overlap
+        if total - 1 >= self.limit:
+            return math.ceil(self.window * overlap) or 1
+        if self.lockout and total >= self.limit:
+            cache.set(lock, now + self.lockout, self.lockout)
+        return 0
+
+    def release(self, identity, now=None):
+        """Take back one hit, for an attempt that should not count after all."""
+        _, current, _ = self.keys(identity, time.time() if now is None else now)
+        try:
+            cache.decr(current)
+        except ValueError:
+            pass
+
+    def reset(self, identity, now=None):
+        cache.delete_many(self.keys(identity, time.time() if now is None else now))
+
+
+def client_ip(request):
+    header = settings.SHOP_CLIENT_IP_HEADER
+    if header and request.META.get(header):
+        # Set by the reverse proxy; the right-most address is the one it saw.
+        return request.META[header].split(',')[-1].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def login_guards(request, username):
+    window = settings.SHOP_LOGIN_WINDOW
+    return [
+        # Anyone can post a username, so it only gets the sliding window: a
+        # lockout would let strangers keep the owner out of their account.
+        (SlidingWindowLimiter('login:username', settings.SHOP_LOGIN_USERNAME_LIMIT, window), username or ''),
+        (SlidingWindowLimiter('login:ip', settings.SHOP_LOGIN_IP_LIMIT, window, settings.SHOP_LOGIN_LOCKOUT),
+         client_ip(request)),
+    ]
+
+
+def register_guards(request):
+    return [
+        (SlidingWindowLimiter('register:ip', settings.SHOP_REGISTER_IP_LIMIT, settings.SHOP_LOGIN_WINDOW,
+                              settings.SHOP_LOGIN_LOCKOUT), client_ip(request)),
+    ]
+
+
+def retry_after(guards):
+    return max(limiter.retry_after(identity) for limiter, identity in guards)
+
+
+def hit(guards):
+    """
+    Count an attempt against every guard and return the longest wait, 0 to
+    go ahead. An attempt that is turned away is taken back off every count.
+    """
+    now = time.time()
+    wait = max([limiter.hit(identity, now) for limiter, identity in guards])
+    if wait:
+        release(guards, now)
+    return wait
+
+
+def release(guards, now=None):
+    for limiter, identity in guards:
+        limiter.release(identity, now)
+
+
+def throttled(request, template_name, seconds):
+    # Same page and cost whatever the username, so it reveals nothing about accounts.
+    response = render(request, template_name, {'error': 'Too many attempts, try again later.'}, status=429)
+    response['Retry-After'] = str(seconds)
+    return response
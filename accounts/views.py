@@ -3,6 +3,8 @@ from django.contrib.auth.models import User
 from django.shortcuts import render, redirect
 from django.views import View
 
+from accounts import throttling
+
 
 class CreateUserView(View):
     def get(self, request):
@@ -12,7 +14,14 @@ class CreateUserView(View):
         username = request.POST.get('username')
         password = request.POST.get('password')
         password2 = request.POST.get('password2')
+        guards = throttling.register_guards(request)
+        retry_after = throttling.retry_after(guards)
+        if retry_after:
+            return throttling.throttled(request, 'accounts/create_user.html', retry_after)
         if password != "" and password == password2:
+            retry_after = throttling.hit(guards)
+            if retry_after:
+                return throttling.throttled(request, 'accounts/create_user.html', retry_after)
             if User.objects.filter(username=username).exists():
                 return render(request, 'accounts/create_user.html', {"error": "Username already exists"})
             else:
@@ -30,9 +39,18 @@ class LoginView(View):
     def post(self, request):
         username = request.POST.get('username')
         password = request.POST.get('password')
+        guards = throttling.login_guards(request, username)
+        retry_after = throttling.hit(guards)
+        if retry_after:
+            return throttling.throttled(request, 'accounts/login.html', retry_after)
 
         user = authenticate(username=username, password=password)
         if user is not None:
+            (username_limiter, username), (address_limiter, address) = guards
+            username_limiter.reset(username)
+            # Only failed logins count against the address, so many people
+            # signing in from behind one NAT do not lock it out.
+            address_limiter.release(address)
             redirect_url = request.GET.get('next', 'base')
             login(request, user)
             return redirect(redirect_url)
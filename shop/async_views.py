@@ -0,0 +1,80 @@
+"""
+Async variants of the catalog read views for ASGI deployments
+(``SHOP_ASYNC_VIEWS``). They share templates, cache keys and context with
+the sync views in shop.views and only replace how data is fetched: the async
+ORM and the async cache API instead of a thread per request.
+"""
+from django.conf import settings
+from django.http import Http404
+from django.shortcuts import render
+
+from shop import catalog_cache, facets, search
+from shop.models import Brand
+from shop.pagination import akeyset_paginate
+from shop.views import BrandsListView, DetailProductView, ProductCommentsView, ProductListView, ProductSearchView
+
+
+async def arender(request, template_names, context):
+    # Templates read request.user; resolve it here so rendering never runs a
+    # query from the event loop.
+    request.user = await request.auser()
+    return render(request, template_names, context)
+
+
+class AsyncBrandsListView(BrandsListView):
+    async def get(self, request, *args, **kwargs):
+        self.catalog_version = await catalog_cache.acatalog_version()
+        self.object_list = await catalog_cache.aget_or_build(self.cache_key(), self.load_brands)
+        return await arender(request, self.get_template_names(), self.get_context_data())
+
+    async def load_brands(self):
+        return [brand async for brand in Brand.objects.all()]
+
+
+class AsyncProductListView(ProductListView):
+    async def get(self, request, *args, **kwargs):
+        self.facets = await facets.aget_facets()
+        self.object_list = self.get_queryset()
+        page_size = self.get_paginate_by(self.object_list)
+        self.catalog_version, self.listing_version = await catalog_cache.alisting_versions()
+        self.page = await catalog_cache.aget_or_build(
+            self.page_cache_key(page_size), lambda: self.apaginate_queryset(self.object_list, page_size)
+        )
+        return await arender(request, self.get_template_names(), self.get_context_data())
+
+    def paginate_queryset(self, queryset, page_size):
+        # get_context_data() paginates; hand it the page fetched in get().
+        return self.page
+
+
+class AsyncDetailProductView(DetailProductView):
+    async def get(self, request, *args, **kwargs):
+        self.catalog_version, self.product_version = await catalog_cache.aproduct_versions(self.kwargs['pk'])
+        self.object = await catalog_cache.aget_or_build(self.object_cache_key(), self.load_object)
+        self.comments = await catalog_cache.aget_or_build(self.comments_cache_key(), lambda: akeyset_paginate(
+            self.comments_queryset(), ProductCommentsView.keyset_ordering, settings.SHOP_COMMENTS_PAGE_SIZE,
+        ))
+        return await arender(request, self.get_template_names(), self.get_context_data(object=self.object))
+
+    async def load_object(self):
+        try:
+            return await self.get_queryset().aget(pk=self.kwargs['pk'])
+        except self.model.DoesNotExist:
+            raise Http404('No product found matching the query')
+
+    def get_comments(self):
+        return self.comments
+
+
+class AsyncProductSearchView(ProductSearchView):
+    async def get(self, request, *args, **kwargs):
+        query = request.GET.get('q')
+        ids = await search.acached_search_product_ids(query) if query else ()
+        paginator, page, page_ids, is_paginated = super().paginate_queryset(ids, self.paginate_by)
+        page.object_list = await search.aload_products(page_ids, self.products_queryset())
+        self.page = (paginator, page, page.object_list, is_paginated)
+        self.object_list = page.object_list
+        return await arender(request, self.get_template_names(), self.get_context_data())
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.page
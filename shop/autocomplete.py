@@ -0,0 +1,220 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+
+from shop.models import Brand, Product
+from shop.search import normalize_query
+
+# Name suffixes indexed per object, so 'noir' also completes 'Amber noir 12'.
+MAX_WORDS = 6
+
+# Prefixes up to this long match much of the catalog; their rankings are kept
+# precomputed rather than worked out from the whole range on every keystroke.
+SHORT_PREFIX = 2
+
+
+def index_keys(name):
+    words = normalize_query(name).split()[:MAX_WORDS]
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+class PrefixIndex:
+    """
+    In-process sorted array of ``(normalized key, kind, pk)`` entries searched
+    with bisect. Holds at most ``max_entries`` keys; once full, new objects are
+    left out until the next rebuild, which keeps the most discussed products.
+    The best ``top_size`` objects for each short prefix are ranked in advance.
+    """
+    def __init__(self, max_entries, top_size=10):
+        self.max_entries = max_entries
+        self.top_size = top_size
+        self.entries = []
+        self.keys = {}
+        self.items = {}
+        # Sort key per object: brands first, then by score, then by label.
+        self.ranks = {}
+        self.top = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @classmethod
+    def build(cls, max_entries, items, top_size=10):
+        """
+        Index ``(kind, pk, label, url, score)`` items, sorting the keys once at
+        the end instead of inserting each in place. Stops at the first item that
+        no longer fits, so pass the ones to keep first.
+        """
+        index = cls(max_entries, top_size)
+        for kind, pk, label, url, score in items:
+            keys = index_keys(label)
+            if len(index.entries) + len(keys) > max_entries:
+                break
+            index.entries.extend((key, kind, pk) for key in keys)
+            index.keys[(kind, pk)] = keys
+            index.items[(kind, pk)] = {'type': kind, 'id': pk, 'label': label, 'url': url}
+            index.ranks[(kind, pk)] = (kind != 'brand', -score, label)
+        index.entries.sort()
+        short = {key[:size] for key, _, _ in index.entries for size in range(1, SHORT_PREFIX + 1)}
+        index.top = {prefix: index._rank(prefix, top_size) for prefix in short}
+        return index
+
+    def add(self, kind, pk, label, url, score=0):
+        with self.lock:
+            self._remove((kind, pk))
+            keys = index_keys(label)
+            if len(self.entries) + len(keys) > self.max_entries:
+                return False
+            for key in keys:
+                insort(self.entries, (key, kind, pk))
+            self.keys[(kind, pk)] = keys
+            self.items[(kind, pk)] = {'type': kind, 'id': pk, 'label': label, 'url': url}
+            self.ranks[(kind, pk)] = (kind != 'brand', -score, label)
+            self._forget(keys)
+            return True
+
+    def remove(self, kind, pk):
+        with self.lock:
+            self._remove((kind, pk))
+
+    def _remove(self, ident):
+        keys = self.keys.pop(ident, ())
+        for key in keys:
+            index = bisect_left(self.entries, (key, *ident))
+            if index < len(self.entries) and self.entries[index] == (key, *ident):
+                del self.entries[index]
+        self.items.pop(ident, None)
+        self.ranks.pop(ident, None)
+        self._forget(keys)
+
+    def _forget(self, keys):
+        # Short prefix rankings these keys fall under are ranked again on next use.
+        for key in keys:
+            for size in range(1, SHORT_PREFIX + 1):
+                self.top.pop(key[:size], None)
+
+    def _rank(self, prefix, limit):
+        """Ids of the best ``limit`` objects with a key starting with ``prefix``."""
+        start = bisect_left(self.entries, (prefix,))
+        end = bisect_left(self.entries, (prefix + '\U0010ffff',), start)
+        found = {(kind, pk) for _, kind, pk in self.entries[start:end]}
+        return heapq.nsmallest(limit, found, key=self.ranks.__getitem__)
+
+    def suggest(self, prefix, limit):
+        """
+        Top ``limit`` objects with a key starting with ``prefix``: brands first,
+        then products by score, then by label.
+        """
+        prefix = normalize_query(prefix)
+        if not prefix:
+            return []
+        with self.lock:
+            if len(prefix) <= SHORT_PREFIX and limit <= self.top_size:
+                ranked = self.top.get(prefix)
+                if ranked is None:
+                    ranked = self.top[prefix] = self._rank(prefix, self.top_size)
+                ranked = ranked[:limit]
+            else:
+                ranked = self._rank(prefix, limit)
+            return [dict(self.items[ident]) for ident in ranked]
+
+
+_index = None
+_built_at = 0
+_build_lock = threading.Lock()
+# Changes signalled while a background rebuild runs, replayed onto its result.
+_pending = None
+_state_lock = threading.Lock()
+
+
+def brand_url(pk):
+    return f"{reverse('products_list')}?brand={pk}"
+
+
+def build_index():
+    def items():
+        for pk, name in Brand.objects.values_list('pk', 'name').iterator():
+            yield 'brand', pk, name, brand_url(pk), 0
+        products = Product.objects.order_by('-comment_count', '-pk').values_list('pk', 'name', 'comment_count')
+        for pk, name, comment_count in products.iterator():
+            yield 'product', pk, name, reverse('detail_product', args=(pk,)), comment_count
+    return PrefixIndex.build(settings.SHOP_AUTOCOMPLETE_MAX_ENTRIES, items(), settings.SHOP_AUTOCOMPLETE_LIMIT)
+
+
+def get_index():
+    """
+    The process-wide index. The first call builds it; after that it is rebuilt
+    every SHOP_AUTOCOMPLETE_REFRESH seconds in a background thread, to pick up
+    writes made by other processes, while requests keep using the current one.
+    Signals keep it current for writes made by this process.
+    """
+    global _index, _built_at
+    index = _index
+    if index is None:
+        with _build_lock:
+            if _index is None:
+                _index = build_index()
+                _built_at = time.monotonic()
+            index = _index
+    elif time.monotonic() - _built_at > settings.SHOP_AUTOCOMPLETE_REFRESH and _build_lock.acquire(blocking=False):
+        _built_at = time.monotonic()
+        threading.Thread(target=_refresh, name='autocomplete-refresh', daemon=True).start()
+    return index
+
+
+def _refresh():
+    """Build a new index and swap it in; runs with _build_lock held."""
+    global _index, _pending
+    try:
+        with _state_lock:
+            _pending = []
+        index = build_index()
+        with _state_lock:
+            for method, args in _pending:
+                getattr(index, method)(*args)
+            _index = index
+    finally:
+        with _state_lock:
+            _pending = None
+        connections.close_all()
+        _build_lock.release()
+
+
+def _apply(method, *args):
+    with _state_lock:
+        if _index is not None:
+            getattr(_index, method)(*args)
+        if _pending is not None:
+            _pending.append((method, args))
+
+
+def reset_index():
+    global _index
+    _index = None
+
+
+def product_saved(product):
+    score = product.__dict__.get('comment_count', 0)
+    _apply('add', 'product', product.pk, product.name, product.get_absolute_url(), score)
+
+
+def product_deleted(product_pk):
+    _apply('remove', 'product', product_pk)
+
+
+def brand_saved(brand):
+    _apply('add', 'brand', brand.pk, brand.name, brand_url(brand.pk))
+
+
+def brand_deleted(brand_pk):
+    _apply('remove', 'brand', brand_pk)
+
+
+def suggest(prefix, limit=None):
+    return get_index().suggest(prefix, limit or settings.SHOP_AUTOCOMPLETE_LIMIT)
@@ -0,0 +1,275 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from shop.models import Product
+
+
+class Context:
+    """
+    Per-worker state: a logged-in test client plus the ids the scenarios pick
+    from. Scenarios return the response of the request being measured.
+    """
+    def __init__(self, client, user, product_ids, rng):
+        self.client = client
+        self.user = user
+        self.product_ids = product_ids
+        self.rng = rng
+
+    def product_id(self):
+        return self.rng.choice(self.product_ids)
+
+
+def products_list(ctx):
+    return ctx.client.get(reverse('products_list'))
+
+
+def brands_list(ctx):
+    return ctx.client.get(reverse('brands_list'))
+
+
+def detail_product(ctx):
+    return ctx.client.get(reverse('detail_product', args=(ctx.product_id(),)))
+
+
+def product_search(ctx):
+    word = ctx.rng.choice(('classic', 'sport', 'rose', 'amber noir', 'fresh', 'oud', 'bl'))
+    return ctx.client.get(reverse('product_search'), {'q': word})
+
+
+def cart(ctx):
+    return ctx.client.get(reverse('cart'))
+
+
+def add_to_cart(ctx):
+    return ctx.client.post(reverse('add_to_cart', args=(ctx.product_id(),)))
+
+
+def create_order(ctx):
+    add_to_cart(ctx)
+    return ctx.client.post(reverse('create_order'))
+
+
+def order_list(ctx):
+    return ctx.client.get(reverse('order_list'))
+
+
+def login_flood(ctx):
+    """Wrong passwords for a real account, as in a credential-stuffing burst."""
+    return ctx.client.post(reverse('login'), {'username': ctx.user.username, 'password': 'not-the-password'})
+
+
+# Throttled attempts are the expected outcome, not errors.
+login_flood.expected_statuses = {429}
+
+
+def mixed(ctx):
+    """Read-heavy traffic with concurrent cart writes: 4 reads for every write."""
+    return ctx.rng.choice((products_list, detail_product, detail_product, cart, add_to_cart))(ctx)
+
+
+SCENARIOS = {
+    'products_list': products_list,
+    'brands_list': brands_list,
+    'detail_product': detail_product,
+    'product_search': product_search,
+    'cart': cart,
+    'add_to_cart': add_to_cart,
+    'create_order': create_order,
+    'order_list': order_list,
+    'mixed': mixed,
+    'login_flood': login_flood,
+}
+
+
+# Single-request scenarios that also run against the ASGI handler, where the
+# client returns an awaitable instead of a response.
+ASGI_SCENARIOS = ('products_list', 'brands_list', 'detail_product', 'product_search')
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def record_transfer(transfer, response):
+    """Count the body bytes sent and, when CompressionMiddleware compressed it, the bytes and CPU it saved."""
+    if response.streaming:
+        return
+    transfer['responses'] += 1
+    transfer['bytes'] += len(response.content)
+    encoder = getattr(response, 'compression', None)
+    if encoder is not None:
+        transfer['compressed'] += 1
+        transfer['original_bytes'] += encoder.original
+        transfer['compressed_bytes'] += encoder.compressed
+        transfer['compress_cpu'] += encoder.cpu_time
+
+
+def summarize_transfer(transfer):
+    if not transfer.get('responses'):
+        return {'bytes_per_response': None, 'compression': None}
+    summary = {'bytes_per_response': round(transfer['bytes'] / transfer['responses'])}
+    if not transfer.get('compressed'):
+        summary['compression'] = None
+        return summary
+    summary['compression'] = {
+        'compressed_responses': transfer['compressed'],
+        'ratio': round(transfer['original_bytes'] / transfer['compressed_bytes'], 2),
+        'original_bytes_per_response': round(transfer['original_bytes'] / transfer['compressed']),
+        'cpu_ms_per_response': round(transfer['compress_cpu'] * 1000 / transfer['compressed'], 3),
+    }
+    return summary
+
+
+def summarize(durations, errors, wall_time, queries=None, cpu_time=None, transfer=None):
+    durations = sorted(durations)
+    ms = [d * 1000 for d in durations]
+    return {
+        'requests': len(durations),
+        'errors': sum(errors.values()),
+        'error_kinds': dict(errors),
+        'throughput_rps': round(len(durations) / wall_time, 2) if wall_time else None,
+        'queries_per_request': round(queries / len(durations), 2) if queries is not None and durations else None,
+        'cpu_ms_per_request': round(cpu_time * 1000 / len(durations), 3) if cpu_time is not None and durations else None,
+        'mean_ms': round(statistics.fmean(ms), 3) if ms else None,
+        'p50_ms': round(percentile(ms, 0.50), 3) if ms else None,
+        'p95_ms': round(percentile(ms, 0.95), 3) if ms else None,
+        'p99_ms': round(percentile(ms, 0.99), 3) if ms else None,
+        **summarize_transfer(transfer or {}),
+    }
+
+
+def run_scenario(scenario, requests, concurrency, users, product_ids, host='localhost', seed=0, client_class=Client,
+                 accept_encoding=''):
+    """
+    Fire ``requests`` calls of ``scenario`` from ``concurrency`` threads, each
+    with its own logged-in client and database connection, and summarize the
+    latency of every call.
+    """
+    durations = []
+    errors = Counter()
+    queries = Counter()
+    transfer = Counter()
+    expected = getattr(scenario, 'expected_statuses', ())
+    lock = threading.Lock()
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    def worker(index, count):
+        rng = random.Random(seed + index)
+        client = client_class(HTTP_HOST=host, headers={'Accept-Encoding': accept_encoding} if accept_encoding else None)
+        user = users[index % len(users)] if users else None
+        if user is not None:
+            client.force_login(user)
+        ctx = Context(client, user, product_ids, rng)
+        local, failed, executed, sent = [], Counter(), Counter(), Counter()
+
+        def count_query(execute, sql, params, many, context):
+            executed['queries'] += 1
+            return execute(sql, params, many, context)
+
+        try:
+            with ExitStack() as stack:
+                # Connections are per thread, so this only sees this worker's queries.
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(count_query))
+                for _ in range(count):
+                    start = time.perf_counter()
+                    try:
+                        response = scenario(ctx)
+                        if response.status_code >= 400 and response.status_code not in expected:
+                            failed[f'status_{response.status_code}'] += 1
+                        record_transfer(sent, response)
+                    except Exception as e:
+                        failed[type(e).__name__] += 1
+                    local.append(time.perf_counter() - start)
+        finally:
+            connections.close_all()
+        with lock:
+            durations.extend(local)
+            errors.update(failed)
+            queries.update(executed)
+            transfer.update(sent)
+
+    start, cpu_start = time.perf_counter(), time.process_time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, i, n) for i, n in enumerate(per_worker) if n]:
+            future.result()
+    return summarize(durations, errors, time.perf_counter() - start, queries['queries'],
+                     time.process_time() - cpu_start, transfer)
+
+
+def run_benchmark(names, requests, concurrency, host='localhost', users_prefix='loaduser', seed=0, accept_encoding=''):
+    users = list(User.objects.filter(username__startswith=users_prefix).order_by('pk')[:max(concurrency, 1)])
+    product_ids = list(Product.objects.values_list('pk', flat=True)[:10000])
+    if not product_ids:
+        raise ValueError('No products to benchmark against, run generate_catalog first.')
+    results = {}
+    for name in names:
+        results[name] = run_scenario(SCENARIOS[name], requests, concurrency, users, product_ids, host, seed,
+                                     accept_encoding=accept_encoding)
+    return results
+
+
+def run_asgi_scenario(scenario, requests, concurrency, product_ids, seed=0, accept_encoding=''):
+    """
+    Like run_scenario() but through Django's ASGI handler: ``concurrency``
+    coroutines on one event loop, as an ASGI server would run them. Sync
+    views are handed to a worker thread per request; async views are not.
+    """
+    durations = []
+    errors = Counter()
+    transfer = Counter()
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+
+    async def worker(index, count):
+        client = AsyncClient(headers={'Accept-Encoding': accept_encoding} if accept_encoding else None)
+        ctx = Context(client, None, product_ids, random.Random(seed + index))
+        for _ in range(count):
+            start = time.perf_counter()
+            try:
+                response = await scenario(ctx)
+                if response.status_code >= 400:
+                    errors[f'status_{response.status_code}'] += 1
+                record_transfer(transfer, response)
+            except Exception as e:
+                errors[type(e).__name__] += 1
+            durations.append(time.perf_counter() - start)
+
+    async def run():
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(i, n) for i, n in enumerate(per_worker) if n))
+        wall_time = time.perf_counter() - start
+        await sync_to_async(connections.close_all)()
+        return wall_time
+
+    # async_to_sync keeps the thread-sensitive ORM calls on the calling thread.
+    cpu_start = time.process_time()
+    wall_time = async_to_sync(run)()
+    return summarize(durations, errors, wall_time, cpu_time=time.process_time() - cpu_start, transfer=transfer)
+
+
+def run_asgi_benchmark(names, requests, concurrency, host='localhost', seed=0, accept_encoding=''):
+    product_ids = list(Product.objects.values_list('pk', flat=True)[:10000])
+    if not product_ids:
+        raise ValueError('No products to benchmark against, run generate_catalog first.')
+    # AsyncClient always sends "Host: testserver".
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        return {
+            name: run_asgi_scenario(SCENARIOS[name], requests, concurrency, product_ids, seed, accept_encoding)
+            for name in names
+        }
@@ -0,0 +1,116 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+# Product listings also show comment counters and sort by them, which
+# comment writes change without touching the catalog version.
+LISTING_VERSION_KEY = 'catalog:listing:version'
+
+MISSING = object()
+
+
+def product_version_key(product_pk):
+    return f'catalog:product:{product_pk}:version'
+
+
+def _new_version():
+    # Random tokens rather than counters: if a version key is evicted, a fresh
+    # token can never collide with fragments cached under an older one.
+    return uuid.uuid4().hex[:12]
+
+
+def get_versions(*keys):
+    versions = cache.get_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    for key, version in missing.items():
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+        versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def in_process_cache():
+    """
+    True when the default cache lives in this process. Its calls never block,
+    so async code may make them directly instead of hopping to a thread.
+    """
+    return isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+async def aget_versions(*keys):
+    if in_process_cache():
+        return get_versions(*keys)
+    versions = await cache.aget_many(keys)
+    missing = {key: _new_version() for key in keys if key not in versions}
+    for key, version in missing.items():
+        if not await cache.aadd(key, version, None):
+            version = await cache.aget(key, version)
+        versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def catalog_version():
+    return get_versions(CATALOG_VERSION_KEY)[0]
+
+
+def product_versions(product_pk):
+    """Return ``(catalog version, product version)`` in one cache round trip."""
+    return get_versions(CATALOG_VERSION_KEY, product_version_key(product_pk))
+
+
+def listing_versions():
+    """Return ``(catalog version, listing version)`` in one cache round trip."""
+    return get_versions(CATALOG_VERSION_KEY, LISTING_VERSION_KEY)
+
+
+async def acatalog_version():
+    return (await aget_versions(CATALOG_VERSION_KEY))[0]
+
+
+async def aproduct_versions(product_pk):
+    return await aget_versions(CATALOG_VERSION_KEY, product_version_key(product_pk))
+
+
+async def alisting_versions():
+    return await aget_versions(CATALOG_VERSION_KEY, LISTING_VERSION_KEY)
+
+
+def invalidate_catalog():
+    cache.set(CATALOG_VERSION_KEY, _new_version(), None)
+
+
+def invalidate_listing():
+    cache.set(LISTING_VERSION_KEY, _new_version(), None)
+
+
+def invalidate_product(product_pk):
+    cache.set(product_version_key(product_pk), _new_version(), None)
+
+
+def make_key(*parts):
+    return 'catalog:' + ':'.join(str(part) for part in parts)
+
+
+def get_or_build(key, build):
+    value = cache.get(key, MISSING)
+    if value is MISSING:
+        value = build()
+        cache.set(key, value, settings.SHOP_CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+async def aget_or_build(key, build):
+    """get_or_build() for async views; ``build`` is a coroutine function."""
+    direct = in_process_cache()
+    value = cache.get(key, MISSING) if direct else await cache.aget(key, MISSING)
+    if value is MISSING:
+        value = await build()
+        if direct:
+            cache.set(key, value, settings.SHOP_CATALOG_CACHE_TIMEOUT)
+        else:
+            await cache.aset(key, value, settings.SHOP_CATALOG_CACHE_TIMEOUT)
+    return value
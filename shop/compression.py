@@ -0,0 +1,112 @@
+"""
+Content codings for CompressionMiddleware (shop.middleware). gzip is always
+available; brotli and zstd need the ``brotli`` and ``zstandard`` packages.
+Levels are the fast end of each codec, tuned for pages compressed on every
+request rather than once at build time.
+"""
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+class GzipStream:
+    def __init__(self):
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data, flush=False):
+        if flush:
+            return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data, flush=False):
+        if flush:
+            return self.compressor.process(data) + self.compressor.flush()
+        return self.compressor.process(data)
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class ZstdStream:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data, flush=False):
+        if flush:
+            return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self.compressor.compress(data)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+STREAMS = {'gzip': GzipStream}
+if brotli is not None:
+    STREAMS['br'] = BrotliStream
+if zstandard is not None:
+    STREAMS['zstd'] = ZstdStream
+
+
+class Encoder:
+    """
+    Compressor for one response body. Counts bytes in and out and the thread
+    CPU time spent, which the benchmark reports per view.
+    """
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.stream = STREAMS[encoding]()
+        self.original = 0
+        self.compressed = 0
+        self.cpu_time = 0.0
+
+    def compress(self, data, flush=False):
+        start = time.thread_time()
+        out = self.stream.compress(data, flush)
+        self.cpu_time += time.thread_time() - start
+        self.original += len(data)
+        self.compressed += len(out)
+        return out
+
+    def finish(self):
+        start = time.thread_time()
+        out = self.stream.finish()
+        self.cpu_time += time.thread_time() - start
+        self.compressed += len(out)
+        return out
+
+    def compress_all(self, data):
+        return self.compress(data) + self.finish()
+
+    def compress_chunks(self, chunks):
+        """Compress an iterable of byte strings, flushing after each so none is held back."""
+        for chunk in chunks:
+            if chunk:
+                yield self.compress(chunk, flush=True)
+        yield self.finish()
+
+    async def acompress_chunks(self, chunks):
+        async for chunk in chunks:
+            if chunk:
+                yield self.compress(chunk, flush=True)
+        yield self.finish()
@@ -0,0 +1,70 @@
+"""
+Validators for conditional GET on the brand list, product and order pages.
+They come from updated_at timestamps plus counts (so deletions show too), not
+from the rendered body, so a matching If-None-Match is answered with 304
+before the view queries or renders anything. Catalog validators are cached
+under the same versions as the pages themselves.
+
+Every page shows the user's name, superuser links and a CSRF token, so the
+ETag also covers the user, their superuser flag and the CSRF cookie, and
+responses are private and must be revalidated on every use. There is no
+Last-Modified: a date cannot tell two users' copies of a page apart.
+"""
+import hashlib
+
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.decorators import method_decorator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from shop import catalog_cache
+from shop.models import Brand, Comment, Order, Product
+
+
+def brand_list_validators(request):
+    def build():
+        totals = Brand.objects.aggregate(count=Count('pk'), updated_at=Max('updated_at'))
+        return totals['count'], totals['updated_at']
+    return catalog_cache.get_or_build(catalog_cache.make_key('brands_validators', catalog_cache.catalog_version()),
+                                      build)
+
+
+def product_validators(request, pk):
+    def build():
+        # comment_count is kept current by the comment signals; it changes when a comment is deleted.
+        return (
+            Product.objects.filter(pk=pk)
+            .annotate(comments_updated_at=Subquery(
+                Comment.objects.filter(product=OuterRef('pk')).order_by('-updated_at').values('updated_at')[:1]
+            ))
+            .values_list('updated_at', 'brand__updated_at', 'comment_count', 'comments_updated_at')
+            .first()
+        )
+    catalog_version, product_version = catalog_cache.product_versions(pk)
+    return catalog_cache.get_or_build(catalog_cache.make_key('product_validators', pk, catalog_version,
+                                                             product_version), build)
+
+
+def order_validators(request, pk):
+    # Orders are written once; total_amount and item_count change if its lines are edited.
+    return Order.objects.filter(pk=pk).values_list('date', 'total_amount', 'item_count').first()
+
+
+def conditional(validators):
+    """
+    Decorate a class-based view's get() with condition() driven by
+    ``validators(request, **kwargs)``, which returns a tuple of parts or None
+    when the object does not exist (the view then raises its 404).
+    """
+    def etag(request, *args, **kwargs):
+        found = validators(request, *args, **kwargs)
+        if found is None:
+            return None
+        user = request.user
+        parts = (validators.__name__, *found, user.pk, user.is_superuser, request.META.get('CSRF_COOKIE'))
+        return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+    return method_decorator([
+        cache_control(private=True, no_cache=True),
+        condition(etag_func=etag),
+    ], name='get')
@@ -1,6 +1,8 @@
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import cache
 
+from shop import autocomplete, search
 from shop.models import Brand, Product, Comment, Cart, CartProduct, Order
 
 
@@ -67,3 +69,10 @@ def create_product(brand):
         name='Laptop', brand=brand, price=1000,
         for_whom=1, description='A high-quality laptop'
     )
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    autocomplete.reset_index()
+    search.results_cache().clear()
@@ -0,0 +1,91 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from shop import catalog_cache
+from shop.models import Brand, Product
+
+
+def price_bands():
+    """Return ``[(key, label, low, high), ...]`` built from SHOP_PRICE_BANDS; the last band is open-ended."""
+    edges = [Decimal(str(edge)) for edge in settings.SHOP_PRICE_BANDS]
+    bands = []
+    for low, high in zip(edges, edges[1:] + [None]):
+        if high is None:
+            bands.append((f'{low}-', f'${low}+', low, high))
+        else:
+            bands.append((f'{low}-{high}', f'${low} - ${high}', low, high))
+    return bands
+
+
+def price_band_q(key):
+    for band_key, _, low, high in price_bands():
+        if band_key == key:
+            condition = Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            return condition
+    raise ValueError(f'Unknown price band {key!r}')
+
+
+def price_band(price):
+    price = Decimal(str(price))
+    for key, _, low, high in price_bands():
+        if price >= low and (high is None or price < high):
+            return key
+    return None
+
+
+def _brand_counts():
+    return Brand.objects.annotate(count=Count('product')).order_by('name', 'pk').values_list('pk', 'name', 'count')
+
+
+def _bucket_counts():
+    return {
+        **{f'for_whom_{value}': Count('pk', filter=Q(for_whom=value)) for value, _ in Product.CHOICES},
+        **{f'band_{i}': Count('pk', filter=price_band_q(key)) for i, (key, *_) in enumerate(price_bands())},
+    }
+
+
+def _facets(brand_rows, totals):
+    return {
+        'brands': {pk: {'name': name, 'count': count} for pk, name, count in brand_rows},
+        'for_whom': {value: totals[f'for_whom_{value}'] for value, _ in Product.CHOICES},
+        'price_bands': {key: totals[f'band_{i}'] for i, (key, *_) in enumerate(price_bands())},
+    }
+
+
+def build_facets():
+    """Aggregate the catalog once: product counts per brand, per for_whom bucket and per price band."""
+    return _facets(list(_brand_counts()), Product.objects.aggregate(**_bucket_counts()))
+
+
+async def abuild_facets():
+    return _facets([row async for row in _brand_counts()], await Product.objects.aaggregate(**_bucket_counts()))
+
+
+def facets_key():
+    # Any product or brand write bumps the catalog version, so the next read
+    # aggregates afresh instead of patching a shared entry concurrent writers
+    # could race on.
+    return catalog_cache.make_key('facets', catalog_cache.catalog_version())
+
+
+def get_facets():
+    key = facets_key()
+    facets = cache.get(key)
+    if facets is None:
+        facets = build_facets()
+        cache.set(key, facets, settings.SHOP_FACET_CACHE_TIMEOUT)
+    return facets
+
+
+async def aget_facets():
+    key = catalog_cache.make_key('facets', await catalog_cache.acatalog_version())
+    facets = await cache.aget(key)
+    if facets is None:
+        facets = await abuild_facets()
+        await cache.aset(key, facets, settings.SHOP_FACET_CACHE_TIMEOUT)
+    return facets
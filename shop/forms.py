@@ -1,6 +1,8 @@
 from django import forms
+from django.conf import settings
 from django.db.models import Q
 
+from shop.facets import price_band_q, price_bands
 from shop.models import Comment, Product
 
 
@@ -11,3 +13,62 @@ class AddCommentForm(forms.ModelForm):
         widgets = {
             'text': forms.Textarea(attrs={'class': 'form-control'})
         }
+
+
+class ProductFilterForm(forms.Form):
+    brand = forms.TypedMultipleChoiceField(coerce=int, required=False)
+    for_whom = forms.TypedMultipleChoiceField(choices=Product.CHOICES, coerce=int, required=False)
+    price_band = forms.ChoiceField(required=False)
+    min_price = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+    max_price = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+
+    def __init__(self, *args, facets, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Choices come from the cached facets so validating a filter costs no query.
+        self.fields['brand'].choices = [(pk, brand['name']) for pk, brand in facets['brands'].items()]
+        self.fields['price_band'].choices = [('', 'Any')] + [(key, label) for key, label, *_ in price_bands()]
+
+    def filter(self, queryset):
+        """Narrow ``queryset`` by the filters that validated; invalid ones are ignored."""
+        self.is_valid()
+        data = self.cleaned_data
+        if data.get('brand'):
+            queryset = queryset.filter(brand__in=data['brand'])
+        if data.get('for_whom'):
+            queryset = queryset.filter(for_whom__in=data['for_whom'])
+        if data.get('price_band'):
+            queryset = queryset.filter(price_band_q(data['price_band']))
+        if data.get('min_price') is not None:
+            queryset = queryset.filter(price__gte=data['min_price'])
+        if data.get('max_price') is not None:
+            queryset = queryset.filter(price__lte=data['max_price'])
+        return queryset
+
+
+class OrderExportForm(forms.Form):
+    format = forms.ChoiceField(choices=[('csv', 'CSV'), ('jsonl', 'JSON lines')], required=False)
+    date_from = forms.DateField(required=False)
+    date_to = forms.DateField(required=False)
+    user = forms.CharField(required=False, max_length=150)
+
+    def clean(self):
+        data = super().clean()
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise forms.ValidationError('date_from must not be after date_to.')
+        data['format'] = data.get('format') or 'csv'
+        return data
+
+
+class SalesReportForm(forms.Form):
+    by = forms.ChoiceField(choices=[('product', 'Product'), ('brand', 'Brand')], required=False)
+    date_from = forms.DateField()
+    date_to = forms.DateField()
+    limit = forms.IntegerField(required=False, min_value=1, max_value=settings.SHOP_MAX_PAGE_SIZE)
+
+    def clean(self):
+        data = super().clean()
+        if data.get('date_from') and data.get('date_to') and data['date_from'] > data['date_to']:
+            raise forms.ValidationError('date_from must not be after date_to.')
+        data['by'] = data.get('by') or 'product'
+        data['limit'] = data.get('limit') or 10
+        return data
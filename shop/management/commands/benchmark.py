@@ -0,0 +1,73 @@
+import json
+import subprocess
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from shop.benchmark import ASGI_SCENARIOS, SCENARIOS, run_asgi_benchmark, run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Drive the main shop views concurrently and report per-URL throughput and latency percentiles as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Subset of: {", ".join(SCENARIOS)} (default: all).')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--host', default='localhost', help='Host header; must be in ALLOWED_HOSTS.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--accept-encoding', default='gzip, deflate, br, zstd',
+                            help='Accept-Encoding sent with every request, as browsers do; "" for none.')
+        parser.add_argument('--output', help='Write the JSON report to this file as well.')
+        parser.add_argument('--asgi', action='store_true',
+                            help=f'Drive the ASGI handler from one event loop ({", ".join(ASGI_SCENARIOS)}).')
+
+    def handle(self, *args, **options):
+        available = ASGI_SCENARIOS if options['asgi'] else SCENARIOS
+        names = options['scenarios'] or list(available)
+        unknown = set(names) - set(available)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        run = run_asgi_benchmark if options['asgi'] else run_benchmark
+        try:
+            results = run(names, options['requests'], options['concurrency'],
+                          host=options['host'], seed=options['seed'], accept_encoding=options['accept_encoding'])
+        except ValueError as e:
+            raise CommandError(e)
+        report = {
+            'commit': self.commit(),
+            'settings': settings.SETTINGS_MODULE,
+            'database': connection.vendor,
+            'database_options': self.database_options(),
+            'debug': settings.DEBUG,
+            'handler': 'asgi' if options['asgi'] else 'wsgi',
+            'async_views': settings.SHOP_ASYNC_VIEWS,
+            'compress_responses': settings.SHOP_COMPRESS_RESPONSES,
+            'accept_encoding': options['accept_encoding'],
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def database_options(self):
+        options = {'conn_max_age': connection.settings_dict['CONN_MAX_AGE']}
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                    options[pragma] = cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+        return options
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from shop import exports
+
+
+class Command(BaseCommand):
+    help = 'Stream orders and their lines as CSV or JSON lines, in constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.CONTENT_TYPES), default='csv')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First day, YYYY-MM-DD.')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last day, YYYY-MM-DD.')
+        parser.add_argument('--user', help='Only orders of this username.')
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--output', help='Write to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        orders = exports.orders_for_export(options['date_from'], options['date_to'], options['user'])
+        pieces = exports.export(options['format'], orders, options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(pieces)
+        else:
+            for piece in pieces:
+                self.stdout.write(piece, ending='')
@@ -0,0 +1,163 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from shop import catalog_cache, sales, search
+from shop.models import Brand, Product, Comment, Cart, CartProduct, Order, OrderProduct
+
+FOR_WHOM_WEIGHTS = {1: 5, 2: 3, 3: 2}
+
+WORDS = (
+    'classic', 'urban', 'sport', 'eau', 'de', 'parfum', 'toilette', 'intense', 'fresh', 'night',
+    'bloom', 'wood', 'amber', 'citrus', 'musk', 'velvet', 'noir', 'blue', 'rose', 'oud',
+)
+
+
+class Command(BaseCommand):
+    help = 'Generate a synthetic catalog, customers, carts and order history with batched bulk inserts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--brands', type=int, default=200)
+        parser.add_argument('--products', type=int, default=20000)
+        parser.add_argument('--comments-per-product', type=int, default=5)
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--cart-lines', type=int, default=10)
+        parser.add_argument('--orders-per-user', type=int, default=20)
+        parser.add_argument('--lines-per-order', type=int, default=4)
+        parser.add_argument('--days', type=int, default=365, help='Spread order dates over this many days.')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--password', default='benchmark', help='Password set on every generated user.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        brands = self.create_brands(options['brands'])
+        products = self.create_products(brands, options['products'])
+        product_ids = list(products)
+        users = self.create_users(options['users'], options['password'])
+        self.create_comments(product_ids, users, options['comments_per_product'])
+        self.create_carts(product_ids, users, options['cart_lines'])
+        self.create_orders(products, users, options['orders_per_user'], options['lines_per_order'], options['days'])
+        indexed = search.rebuild_index()
+        # bulk_create skips the signals that normally invalidate cached pages.
+        catalog_cache.invalidate_catalog()
+        sales.refresh(rebuild=True)
+        self.stdout.write(self.style.SUCCESS(f'Done, {indexed} products in the search index.'))
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def price(self):
+        # Log-normal around ~50 with a long tail of premium products.
+        value = min(self.rng.lognormvariate(3.9, 0.7), 5000)
+        return Decimal(f'{max(int(value), 1)}.99')
+
+    def name(self, index):
+        words = self.rng.sample(WORDS, 2)
+        return f'{words[0].title()} {words[1]} {index}'
+
+    def create_brands(self, count):
+        brands = Brand.objects.bulk_create(
+            (Brand(name=f'Brand {i}') for i in range(count)), batch_size=self.batch_size
+        )
+        self.log(f'{len(brands)} brands')
+        return brands
+
+    def create_products(self, brands, count):
+        # A few brands carry most of the catalog.
+        brand_weights = [1 / (rank + 1) for rank in range(len(brands))]
+        choices, weights = zip(*FOR_WHOM_WEIGHTS.items())
+        products = {}
+        for start in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - start)
+            product_brands = self.rng.choices(brands, brand_weights, k=size)
+            product_for_whom = self.rng.choices(choices, weights, k=size)
+            batch = Product.objects.bulk_create(
+                Product(
+                    name=self.name(start + i),
+                    brand=product_brands[i],
+                    price=self.price(),
+                    for_whom=product_for_whom[i],
+                    description=' '.join(self.rng.choices(WORDS, k=30)),
+                )
+                for i in range(size)
+            )
+            products.update((p.pk, (p.name, p.price)) for p in batch)
+        self.log(f'{len(products)} products')
+        return products
+
+    def create_users(self, count, password):
+        hashed = make_password(password)
+        users = User.objects.bulk_create(
+            (User(username=f'loaduser{i}', password=hashed) for i in range(count)),
+            batch_size=self.batch_size,
+        )
+        self.log(f'{len(users)} users')
+        return users
+
+    def create_comments(self, product_ids, users, per_product):
+        if not users:
+            return
+        batch = []
+        total = 0
+        for product_id in product_ids:
+            for _ in range(self.rng.randint(0, 2 * per_product)):
+                batch.append(Comment(product_id=product_id, user=self.rng.choice(users),
+                                     text=' '.join(self.rng.choices(WORDS, k=12))))
+            if len(batch) >= self.batch_size:
+                Comment.objects.bulk_create(batch)
+                total += len(batch)
+                batch = []
+        Comment.objects.bulk_create(batch)
+        # bulk_create skips the signals that maintain the denormalized counters.
+        Product.objects.refresh_comment_stats()
+        self.log(f'{total + len(batch)} comments')
+
+    def create_carts(self, product_ids, users, lines):
+        carts = Cart.objects.bulk_create((Cart(user=user) for user in users), batch_size=self.batch_size)
+        batch = []
+        for cart in carts:
+            for product_id in self.rng.sample(product_ids, min(lines, len(product_ids))):
+                batch.append(CartProduct(cart=cart, product_id=product_id, quantity=self.rng.randint(1, 3)))
+        CartProduct.objects.bulk_create(batch, batch_size=self.batch_size)
+        self.log(f'{len(carts)} carts with {len(batch)} lines')
+
+    def create_orders(self, products, users, per_user, lines_per_order, days):
+        product_ids = list(products)
+        now = timezone.now()
+        users_per_batch = max(1, self.batch_size // max(per_user, 1))
+        orders_total = lines_total = 0
+        for start in range(0, len(users), users_per_batch):
+            orders, dates, picks = [], [], []
+            for user in users[start:start + users_per_batch]:
+                for _ in range(per_user):
+                    picked = self.rng.sample(product_ids, min(lines_per_order, len(product_ids)))
+                    quantities = [self.rng.randint(1, 3) for _ in picked]
+                    orders.append(Order(
+                        user=user,
+                        total_amount=sum(products[pk][1] * q for pk, q in zip(picked, quantities)),
+                        item_count=sum(quantities),
+                    ))
+                    dates.append(now - timedelta(seconds=self.rng.randint(0, days * 86400)))
+                    picks.append(zip(picked, quantities))
+            Order.objects.bulk_create(orders)
+            # auto_now_add overrides dates on insert, so backdate afterwards.
+            for order, date in zip(orders, dates):
+                order.date = date
+            Order.objects.bulk_update(orders, ['date'], batch_size=self.batch_size)
+            order_lines = [
+                OrderProduct(order=order, product_id=pk, quantity=q, name=products[pk][0], price=products[pk][1])
+                for order, picked in zip(orders, picks)
+                for pk, q in picked
+            ]
+            OrderProduct.objects.bulk_create(order_lines, batch_size=self.batch_size)
+            orders_total += len(orders)
+            lines_total += len(order_lines)
+        self.log(f'{orders_total} orders with {lines_total} lines')
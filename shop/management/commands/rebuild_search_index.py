@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+from shop import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index from the product and brand tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if connections[using].vendor != 'sqlite':
+            raise CommandError('The full-text index is only used on SQLite; other backends search with LIKE.')
+        try:
+            count = search.rebuild_index(using=using)
+        except OperationalError as e:
+            raise CommandError(f'Could not build the index: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products.'))
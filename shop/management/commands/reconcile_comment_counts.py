@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Repair drift in Product.comment_count / last_comment_at, walking the catalog in pk batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only report the drifted products.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_pk = 0
+        checked = repaired = 0
+        while True:
+            batch = list(
+                Product.objects.filter(pk__gt=last_pk)
+                .order_by('pk')
+                .only('comment_count', 'last_comment_at')
+                .with_actual_comment_stats()[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            checked += len(batch)
+            drifted = [
+                product for product in batch
+                if (product.comment_count, product.last_comment_at)
+                != (product.actual_comment_count, product.actual_last_comment_at)
+            ]
+            for product in drifted:
+                product.comment_count = product.actual_comment_count
+                product.last_comment_at = product.actual_last_comment_at
+            if drifted and not options['dry_run']:
+                Product.objects.bulk_update(drifted, ['comment_count', 'last_comment_at'])
+            repaired += len(drifted)
+        verb = 'Found' if options['dry_run'] else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} products. {verb} {repaired} drifted.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from shop import sales
+
+
+class Command(BaseCommand):
+    help = 'Roll order lines up into the daily per-product and per-brand sales tables, picking up where the last run stopped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute the whole history.')
+
+    def handle(self, *args, **options):
+        days = sales.refresh(rebuild=options['rebuild'])
+        if days is None:
+            self.stdout.write('No orders to roll up.')
+        else:
+            first, last = days
+            self.stdout.write(self.style.SUCCESS(f'Rolled up sales from {first} to {last}.'))
@@ -0,0 +1,28 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite primary onto every SQLite replica in SHOP_DATABASE_REPLICAS with the online backup API.'
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas are synced here; use the database\'s own replication otherwise.')
+        if not settings.SHOP_DATABASE_REPLICAS:
+            raise CommandError('No replicas configured in SHOP_DATABASE_REPLICAS.')
+        primary.ensure_connection()
+        for alias in settings.SHOP_DATABASE_REPLICAS:
+            replica = connections[alias]
+            # Drop the replica's own connection so the copy is the only writer.
+            replica.close()
+            target = sqlite3.connect(replica.settings_dict['NAME'])
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(f'{alias}: copied to {replica.settings_dict["NAME"]}')
+        self.stdout.write(self.style.SUCCESS(f'Synced {len(settings.SHOP_DATABASE_REPLICAS)} replicas.'))
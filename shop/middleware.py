@@ -0,0 +1,340 @@
+import json
+import logging
+import mimetypes
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from shop.compression import STREAMS, Encoder
+from shop.routers import pinned_to_primary
+from shop.staticfiles import ENCODING_SUFFIXES, hashed_names
+
+logger = logging.getLogger('shop.sql')
+
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?|[-\d.]+|\'[^\']*\')\s*,?)+\)', re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACES = re.compile(r'\s+')
+
+_PROJECT_DIR = str(Path(settings.BASE_DIR).resolve())
+_THIS_FILE = str(Path(__file__).resolve())
+
+
+def normalize_sql(sql):
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _LITERALS.sub('?', sql)
+    return _SPACES.sub(' ', sql).strip()
+
+
+def find_call_site():
+    """
+    Return the innermost project source line and, if a template is being
+    rendered, the template name and line that triggered the current query.
+    """
+    python_site = template_site = None
+    frame = sys._getframe(1)
+    while frame is not None and (python_site is None or template_site is None):
+        filename = frame.f_code.co_filename
+        if python_site is None and filename.startswith(_PROJECT_DIR) and filename != _THIS_FILE:
+            python_site = f'{Path(filename).relative_to(_PROJECT_DIR)}:{frame.f_lineno}'
+        node = frame.f_locals.get('self')
+        if template_site is None and getattr(node, 'token', None) is not None and hasattr(node, 'origin'):
+            template_site = f'{node.origin.template_name}:{node.token.lineno}'
+        frame = frame.f_back
+    return python_site, template_site
+
+
+class QueryRecorder:
+    """
+    ``connection.execute_wrapper`` callable counting and timing every query
+    and remembering where each normalized statement repeated too often.
+    """
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.call_sites = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            statement = normalize_sql(sql)
+            self.statements[statement] += 1
+            if self.statements[statement] == self.threshold + 1:
+                self.call_sites[statement] = find_call_site()
+
+    def repeated(self):
+        return [
+            (statement, count, self.call_sites.get(statement, (None, None)))
+            for statement, count in self.statements.most_common()
+            if count > self.threshold
+        ]
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Opt-in (``SHOP_SQL_INSTRUMENTATION``) per-request SQL accounting. Adds
+    ``Server-Timing`` and ``X-DB-*`` headers, logs one structured line per
+    request to the ``shop.sql`` logger and warns about N+1 patterns: the same
+    normalized statement run more than ``SHOP_NPLUSONE_THRESHOLD`` times.
+    """
+    def __init__(self, get_response):
+        if not settings.SHOP_SQL_INSTRUMENTATION:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder(settings.SHOP_NPLUSONE_THRESHOLD)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        repeated = recorder.repeated()
+        response['Server-Timing'] = (
+            f'db;desc="{recorder.count} queries";dur={recorder.duration * 1000:.2f}, '
+            f'total;dur={elapsed * 1000:.2f}'
+        )
+        response['X-DB-Query-Count'] = str(recorder.count)
+        response['X-DB-Duplicate-Queries'] = str(len(repeated))
+
+        view = getattr(request.resolver_match, 'view_name', None)
+        logger.info(json.dumps({
+            'event': 'request_sql',
+            'method': request.method,
+            'path': request.path,
+            'view': view,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.duration * 1000, 2),
+            'total_ms': round(elapsed * 1000, 2),
+            'duplicates': len(repeated),
+        }))
+        for statement, count, (python_site, template_site) in repeated:
+            logger.warning(json.dumps({
+                'event': 'n_plus_one',
+                'path': request.path,
+                'view': view,
+                'count': count,
+                'sql': statement,
+                'python': python_site,
+                'template': template_site,
+            }))
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Read-your-own-writes for the replica router: a request that writes (any
+    unsafe method) reads from the primary and sets a short-lived cookie that
+    keeps the client's following requests on the primary for
+    ``SHOP_REPLICA_PIN_SECONDS``, long enough for the replicas to catch up.
+    """
+    cookie_name = 'shop_primary'
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SHOP_DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        if not writes and self.cookie_name not in request.COOKIES:
+            return self.get_response(request)
+        with pinned_to_primary():
+            response = self.get_response(request)
+        return self.process_response(request, response, writes)
+
+    async def __acall__(self, request):
+        writes = request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+        if not writes and self.cookie_name not in request.COOKIES:
+            return await self.get_response(request)
+        with pinned_to_primary():
+            response = await self.get_response(request)
+        return self.process_response(request, response, writes)
+
+    def process_response(self, request, response, writes):
+        if writes:
+            response.set_cookie(self.cookie_name, '1', max_age=settings.SHOP_REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+def accepted_encodings(header):
+    """The content codings an Accept-Encoding header allows, lower-cased; ``q=0`` ones are left out."""
+    accepted = set()
+    for token in header.split(','):
+        coding, _, params = token.partition(';')
+        params = params.replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                pass
+        if coding.strip():
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    def __init__(self, path, name, cache_control):
+        self.content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/') or self.content_type in ('application/javascript', 'application/json'):
+            self.content_type += '; charset=utf-8'
+        self.cache_control = cache_control
+        # (encoding, path, etag), best encoding first.
+        self.variants = []
+        for encoding, suffix in [*ENCODING_SUFFIXES.items(), (None, '')]:
+            variant = Path(f'{path}{suffix}')
+            if variant.is_file():
+                stat = variant.stat()
+                self.variants.append((encoding, variant, f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'))
+
+    def select(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding)
+        for variant in self.variants:
+            if variant[0] is None or variant[0] in accepted or '*' in accepted:
+                return variant
+
+
+class StaticFilesMiddleware:
+    """
+    Serve STATIC_ROOT from the application process (SHOP_SERVE_STATIC), for
+    deployments without a web server in front for static files. The files
+    are indexed once at startup, so serving one costs a dict lookup and a
+    read. Names hashed by collectstatic never change and are cached for a
+    year as immutable; the .br / .gz copies it wrote are picked from
+    Accept-Encoding.
+    """
+    immutable = 'public, max-age=31536000, immutable'
+    revalidate = 'public, max-age=0, must-revalidate'
+
+    def __init__(self, get_response):
+        prefix = urlsplit(settings.STATIC_URL)
+        if not settings.SHOP_SERVE_STATIC or not settings.STATIC_ROOT or prefix.netloc:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.prefix = '/' + prefix.path.strip('/') + '/'
+        self.files = self.index(Path(settings.STATIC_ROOT))
+
+    def index(self, root):
+        hashed = hashed_names(root)
+        compressed = tuple(ENCODING_SUFFIXES.values())
+        files = {}
+        for path in root.rglob('*'):
+            if path.is_file() and not path.name.endswith(compressed):
+                name = path.relative_to(root).as_posix()
+                files[name] = StaticFile(path, name, self.immutable if name in hashed else self.revalidate)
+        return files
+
+    def __call__(self, request):
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(self.prefix):
+            return self.get_response(request)
+        static_file = self.files.get(request.path[len(self.prefix):])
+        if static_file is None:
+            return self.get_response(request)
+        encoding, path, etag = static_file.select(request.headers.get('Accept-Encoding', ''))
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(b'' if request.method == 'HEAD' else path.read_bytes(),
+                                    content_type=static_file.content_type)
+            response['Content-Length'] = path.stat().st_size
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Cache-Control'] = static_file.cache_control
+        if len(static_file.variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compress responses on the fly (SHOP_COMPRESS_RESPONSES) with the first of
+    SHOP_COMPRESS_ENCODINGS that the client accepts and this install supports.
+    Bodies under SHOP_COMPRESS_MIN_SIZE, types outside SHOP_COMPRESS_TYPES and
+    responses that are already encoded pass through. Streaming responses are
+    compressed chunk by chunk. The Encoder is left on ``response.compression``
+    for the benchmark.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SHOP_COMPRESS_RESPONSES:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.encodings = [encoding for encoding in settings.SHOP_COMPRESS_ENCODINGS if encoding in STREAMS]
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').partition(';')[0].strip().lower()
+        if response.has_header('Content-Encoding') or content_type not in settings.SHOP_COMPRESS_TYPES:
+            return response
+        if not response.streaming and len(response.content) < settings.SHOP_COMPRESS_MIN_SIZE:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        # BREACH: a secret in a compressed body that also reflects request
+        # input can be recovered from the response sizes. CsrfViewMiddleware
+        # sets the cookie on every response that rendered a token.
+        if settings.SHOP_COMPRESS_SKIP_CSRF and settings.CSRF_COOKIE_NAME in response.cookies:
+            return response
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding = next((encoding for encoding in self.encodings if encoding in accepted), None)
+        if encoding is None:
+            return response
+
+        encoder = Encoder(encoding)
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = encoder.acompress_chunks(response.streaming_content)
+            else:
+                response.streaming_content = encoder.compress_chunks(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            content = encoder.compress_all(response.content)
+            if len(content) >= len(response.content):
+                return response
+            response.content = content
+            response.headers['Content-Length'] = str(len(content))
+        # The compressed body differs byte for byte, so a strong ETag becomes weak.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        response.compression = encoder
+        return response
@@ -0,0 +1,37 @@
+from django.db import migrations, OperationalError
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5("
+            "name, description, brand, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5: search falls back to LIKE queries.
+        return
+    schema_editor.execute(
+        'INSERT INTO shop_product_fts (rowid, name, description, brand) '
+        'SELECT p.id, p.name, p.description, b.name '
+        'FROM shop_product p INNER JOIN shop_brand b ON b.id = p.brand_id'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS shop_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0003_remove_commenttoarticle_article_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:00
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_cart_lines(apps, schema_editor):
+    CartProduct = apps.get_model('shop', 'CartProduct')
+    duplicates = (
+        CartProduct.objects.values('cart_id', 'product_id')
+        .annotate(lines=Count('id'), keep=Min('id'), quantity=Sum('quantity'))
+        .filter(lines__gt=1)
+    )
+    for row in duplicates:
+        lines = CartProduct.objects.filter(cart_id=row['cart_id'], product_id=row['product_id'])
+        lines.filter(id=row['keep']).update(quantity=row['quantity'])
+        lines.exclude(id=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0004_product_search_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_cart_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartproduct',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
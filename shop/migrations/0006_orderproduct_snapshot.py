@@ -0,0 +1,37 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:01
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_order_lines(apps, schema_editor):
+    OrderProduct = apps.get_model('shop', 'OrderProduct')
+    Product = apps.get_model('shop', 'Product')
+    product = Product.objects.filter(pk=OuterRef('product_id'))
+    OrderProduct.objects.update(
+        name=Subquery(product.values('name')[:1]),
+        price=Subquery(product.values('price')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0005_cartproduct_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderproduct',
+            name='name',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='orderproduct',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(snapshot_order_lines, migrations.RunPython.noop),
+    ]
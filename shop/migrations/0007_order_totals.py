@@ -0,0 +1,44 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:01
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('shop', 'Order')
+    OrderProduct = apps.get_model('shop', 'OrderProduct')
+    lines = OrderProduct.objects.filter(order_id=OuterRef('pk')).order_by().values('order_id')
+    line_total = ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    Order.objects.update(
+        total_amount=Coalesce(Subquery(lines.annotate(total=Sum(line_total)).values('total')), 0,
+                              output_field=DecimalField(max_digits=12, decimal_places=2)),
+        item_count=Coalesce(Subquery(lines.annotate(count=Sum('quantity')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_orderproduct_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-date', '-id'], name='order_user_date_idx'),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:09
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0007_order_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['product', '-date', '-id'], name='comment_product_date_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_comment_stats(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Comment = apps.get_model('shop', 'Comment')
+    comments = Comment.objects.filter(product=OuterRef('pk')).order_by()
+    Product.objects.update(
+        comment_count=Coalesce(Subquery(
+            comments.values('product').annotate(count=Count('pk')).values('count')
+        ), 0),
+        last_comment_at=Subquery(comments.order_by('-date').values('date')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_comment_product_date_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='last_comment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-comment_count', '-id'], name='product_popularity_idx'),
+        ),
+        migrations.RunPython(backfill_comment_stats, migrations.RunPython.noop),
+    ]
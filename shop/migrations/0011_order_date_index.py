@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 17:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_product_facet_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date', 'id'], name='order_date_idx'),
+        ),
+    ]
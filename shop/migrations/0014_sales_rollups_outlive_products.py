@@ -0,0 +1,47 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def snapshot_names(apps, schema_editor):
+    for rollup, related in (('DailyProductSales', 'Product'), ('DailyBrandSales', 'Brand')):
+        model = apps.get_model('shop', related)
+        key = f'{related.lower()}_id'
+        apps.get_model('shop', rollup).objects.update(
+            name=Subquery(model.objects.filter(pk=OuterRef(key)).values('name')[:1])
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailybrandsales',
+            name='name',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='dailyproductsales',
+            name='name',
+            field=models.CharField(default='', max_length=100),
+            preserve_default=False,
+        ),
+        migrations.RunPython(snapshot_names, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='dailybrandsales',
+            name='brand',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.brand'),
+        ),
+        migrations.AlterField(
+            model_name='dailyproductsales',
+            name='product',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='shop.product'),
+        ),
+    ]
@@ -2,17 +2,51 @@ from decimal import Decimal
 
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
 from django.urls import reverse
 
 
 class Brand(models.Model):
     name = models.CharField(max_length=100)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f'{self.name}'
 
 
+def comment_count_subquery():
+    comments = Comment.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    return Coalesce(Subquery(comments.annotate(count=Count('pk')).values('count')), 0)
+
+
+def last_comment_subquery():
+    return Subquery(Comment.objects.filter(product=OuterRef('pk')).order_by('-date').values('date')[:1])
+
+
+class ProductQuerySet(models.QuerySet):
+    def comment_added(self, product_id, date):
+        return self.filter(pk=product_id).update(
+            comment_count=F('comment_count') + 1,
+            last_comment_at=Greatest(Coalesce(F('last_comment_at'), Value(date)), Value(date)),
+        )
+
+    def comment_removed(self, product_id):
+        return self.filter(pk=product_id, comment_count__gt=0).update(
+            comment_count=F('comment_count') - 1,
+            last_comment_at=last_comment_subquery(),
+        )
+
+    def refresh_comment_stats(self):
+        """Recompute the counters from scratch, e.g. after bulk-inserting comments."""
+        return self.update(comment_count=comment_count_subquery(), last_comment_at=last_comment_subquery())
+
+    def with_actual_comment_stats(self):
+        return self.annotate(actual_comment_count=comment_count_subquery(),
+                             actual_last_comment_at=last_comment_subquery())
+
+
 class Product(models.Model):
     CHOICES = (
         (1, 'Unisex'),
@@ -28,6 +62,18 @@ class Product(models.Model):
     )
     for_whom = models.IntegerField(choices=CHOICES, default=1)
     description = models.TextField()
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    last_comment_at = models.DateTimeField(null=True, blank=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-comment_count', '-id'], name='product_popularity_idx'),
+            models.Index(fields=['for_whom', 'price'], name='product_for_whom_price_idx'),
+            models.Index(fields=['price'], name='product_price_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('detail_product', args=(self.pk,))
@@ -44,6 +90,13 @@ class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     text = models.TextField()
     date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-date', '-id'], name='comment_product_date_idx'),
+            models.Index(fields=['product', '-updated_at'], name='comment_product_updated_idx'),
+        ]
 
     def get_absolute_url(self):
         return reverse('update_comment', args=(self.pk,))
@@ -52,15 +105,80 @@ class Comment(models.Model):
         return f'{self.product} {self.user} {self.text} {self.date}'
 
 
+def line_total_expression(prefix='', price='product__price'):
+    return ExpressionWrapper(
+        F(f'{prefix}quantity') * F(f'{prefix}{price}'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+
+
+class LineQuerySet(models.QuerySet):
+    def with_totals(self):
+        return self.select_related('product').annotate(line_total=line_total_expression())
+
+    def total(self):
+        return self.aggregate(total=Sum(line_total_expression()))['total'] or 0
+
+
+class OrderProductQuerySet(models.QuerySet):
+    def with_totals(self):
+        return self.annotate(line_total=line_total_expression(price='price'))
+
+    def total(self):
+        return self.aggregate(total=Sum(line_total_expression(price='price')))['total'] or 0
+
+
+class CartProductQuerySet(LineQuerySet):
+    def increment(self, user, product_id):
+        """
+        Add one unit of a product to the user's cart without a read-modify-write:
+        an F() update for an existing line, an insert (retried as an update if a
+        concurrent request created the line first) otherwise. A first add reads
+        the cart id and checks the product in a single query.
+        Returns False when the product does not exist.
+        """
+        line = self.filter(cart__user=user, product_id=product_id)
+        if line.update(quantity=F('quantity') + 1):
+            return True
+        cart_id = Subquery(Cart.objects.filter(user=user).values('pk')[:1])
+        found = Product.objects.filter(pk=product_id).values_list(cart_id, flat=True)
+        if not found:
+            return False
+        cart_id = found[0]
+        if cart_id is None:
+            cart_id = Cart.objects.get_or_create(user=user)[0].pk
+        try:
+            with transaction.atomic():
+                self.create(cart_id=cart_id, product_id=product_id, quantity=1)
+        except IntegrityError:
+            line.update(quantity=F('quantity') + 1)
+        return True
+
+    def decrement(self, user, product_id):
+        """
+        Remove one unit of a product from the user's cart, deleting the line
+        when its quantity would reach zero.
+        """
+        line = self.filter(cart__user=user, product_id=product_id)
+        if not line.filter(quantity__gt=1).update(quantity=F('quantity') - 1):
+            line.filter(quantity__lte=1).delete()
+
+
+class CartQuerySet(models.QuerySet):
+    def with_total(self):
+        return self.annotate(total_amount=Sum(line_total_expression('cartproduct__')))
+
+
 class Cart(models.Model):
     products = models.ManyToManyField(Product, through='CartProduct')
     user = models.OneToOneField(User, on_delete=models.CASCADE)
 
+    objects = CartQuerySet.as_manager()
+
     def total(self):
-        total = 0
-        for cb in self.cartproduct_set.all():
-            total += cb.total()
-        return total
+        if hasattr(self, 'total_amount'):
+            return self.total_amount or 0
+        return self.cartproduct_set.total()
 
     def get_total(self):
         return f'{self.total():.2f}'
@@ -71,26 +189,136 @@ class CartProduct(models.Model):
     cart = models.ForeignKey('Cart', on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
 
+    objects = CartProductQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
+
     def total(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
         return self.quantity * self.product.price
 
 
+class OrderQuerySet(models.QuerySet):
+    def create_from_cart(self, user):
+        """
+        Turn the user's cart into an order in one transaction: lock the cart
+        lines, snapshot product name and price onto bulk-inserted order lines
+        and empty the cart. Returns None when the cart is empty.
+        """
+        with transaction.atomic(using=self.db):
+            if connections[self.db].vendor == 'sqlite':
+                # SQLite has no row locks, and a transaction that starts with a
+                # read fails with "database is locked" instead of waiting
+                # (busy_timeout) when it later needs the write lock. Take it first.
+                CartProduct.objects.filter(cart__user=user).update(quantity=F('quantity'))
+            lines = list(
+                CartProduct.objects.select_for_update(of=('self',))
+                .filter(cart__user=user)
+                .select_related('product')
+                .only('quantity', 'product__name', 'product__price')
+                .order_by('pk')
+            )
+            if not lines:
+                return None
+            order = self.create(
+                user=user,
+                total_amount=sum(line.quantity * line.product.price for line in lines),
+                item_count=sum(line.quantity for line in lines),
+            )
+            OrderProduct.objects.bulk_create([
+                OrderProduct(
+                    order=order,
+                    product_id=line.product_id,
+                    quantity=line.quantity,
+                    name=line.product.name,
+                    price=line.product.price,
+                )
+                for line in lines
+            ])
+            CartProduct.objects.filter(pk__in=[line.pk for line in lines]).delete()
+        return order
+
+
 class Order(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     products = models.ManyToManyField(Product, through='OrderProduct')
     date = models.DateTimeField(auto_now_add=True)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    item_count = models.PositiveIntegerField(default=0)
+
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-date', '-id'], name='order_user_date_idx'),
+            models.Index(fields=['date', 'id'], name='order_date_idx'),
+        ]
 
     def total(self):
-        total = 0
-        for cb in self.orderproduct_set.all():
-            total += cb.total()
-        return f'{total:.2f}'
+        return f'{self.total_amount:.2f}'
+
+    def refresh_totals(self):
+        totals = self.orderproduct_set.aggregate(
+            total=Sum(line_total_expression(price='price')),
+            count=Sum('quantity'),
+        )
+        self.total_amount = totals['total'] or 0
+        self.item_count = totals['count'] or 0
+        self.save(update_fields=['total_amount', 'item_count'])
 
 
 class OrderProduct(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     order = models.ForeignKey('Order', on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
+    name = models.CharField(max_length=100)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    objects = OrderProductQuerySet.as_manager()
 
     def total(self):
-        return self.quantity * self.product.price
+        if hasattr(self, 'line_total'):
+            return self.line_total
+        return self.quantity * self.price
+
+
+class DailyProductSales(models.Model):
+    """
+    Order lines summed per day and product; maintained by ``manage.py rollup_sales``.
+    The product's name is kept on the row, which outlives the product itself.
+    """
+    day = models.DateField()
+    product = models.ForeignKey(Product, null=True, on_delete=models.SET_NULL)
+    name = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_day_product_sales'),
+        ]
+
+
+class DailyBrandSales(models.Model):
+    """Order lines summed per day and brand; maintained by ``manage.py rollup_sales``."""
+    day = models.DateField()
+    brand = models.ForeignKey(Brand, null=True, on_delete=models.SET_NULL)
+    name = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    order_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'brand'], name='unique_day_brand_sales'),
+        ]
+
+
+class SalesRollupState(models.Model):
+    # Orders placed before this have been rolled up.
+    high_water = models.DateTimeField(null=True)
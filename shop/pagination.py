@@ -0,0 +1,186 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise Http404('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise Http404('Invalid cursor')
+    return values
+
+
+def keyset_filter(ordering, values, reverse=False):
+    """
+    Build the row-value comparison ``(f1, f2, ...) > (v1, v2, ...)`` for the
+    given ordering, honouring per-field direction ('-date' sorts descending).
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+        lookup = f'{name}__lt' if descending else f'{name}__gt'
+        condition |= equal & Q(**{lookup: value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+def _filter_cursor(queryset, condition):
+    try:
+        return queryset.filter(condition)
+    except (TypeError, ValueError, ValidationError):
+        raise Http404('Invalid cursor')
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+class KeysetPage:
+    def __init__(self, object_list, ordering, has_next, has_previous):
+        self.object_list = object_list
+        self.ordering = ordering
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_query = ''
+        self.previous_query = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _cursor_for(self, obj):
+        return encode_cursor([getattr(obj, field.lstrip('-')) for field in self.ordering])
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return self._cursor_for(self.object_list[-1])
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return self._cursor_for(self.object_list[0])
+        return None
+
+
+def _keyset_query(queryset, ordering, page_size, after=None, before=None):
+    if before:
+        values = decode_cursor(before, len(ordering))
+        qs = _filter_cursor(queryset, keyset_filter(ordering, values, reverse=True))
+        return qs.order_by(*reverse_ordering(ordering))[:page_size + 1]
+    if after:
+        values = decode_cursor(after, len(ordering))
+        queryset = _filter_cursor(queryset, keyset_filter(ordering, values))
+    return queryset.order_by(*ordering)[:page_size + 1]
+
+
+def _keyset_page(rows, ordering, page_size, after=None, before=None):
+    if before:
+        has_previous = len(rows) > page_size
+        rows = rows[:page_size]
+        rows.reverse()
+        return KeysetPage(rows, ordering, has_next=True, has_previous=has_previous)
+    has_next = len(rows) > page_size
+    return KeysetPage(rows[:page_size], ordering, has_next=has_next, has_previous=bool(after))
+
+
+def keyset_paginate(queryset, ordering, page_size, after=None, before=None):
+    """
+    Return one page of ``queryset`` ordered by ``ordering`` (which must end in a
+    unique column) starting strictly after / before the given cursor. Costs a
+    single query whatever the depth of the page, unlike OFFSET pagination.
+    """
+    ordering = list(ordering)
+    rows = list(_keyset_query(queryset, ordering, page_size, after, before))
+    return _keyset_page(rows, ordering, page_size, after, before)
+
+
+async def akeyset_paginate(queryset, ordering, page_size, after=None, before=None):
+    """keyset_paginate() for async views, fetching the rows with ``async for``."""
+    ordering = list(ordering)
+    rows = [row async for row in _keyset_query(queryset, ordering, page_size, after, before)]
+    return _keyset_page(rows, ordering, page_size, after, before)
+
+
+class KeysetPaginationMixin:
+    """
+    ListView mixin replacing OFFSET pagination with keyset (cursor) pagination.
+    Pages are selected with ``?after=<cursor>`` / ``?before=<cursor>`` and the
+    page size with ``?page_size=`` (capped at ``SHOP_MAX_PAGE_SIZE``).
+    """
+    keyset_ordering = ('pk',)
+    paginate_by = None
+    page_size_setting = 'SHOP_PAGE_SIZE'
+
+    def get_paginate_by(self, queryset):
+        default = self.paginate_by or getattr(settings, self.page_size_setting)
+        try:
+            page_size = int(self.request.GET.get('page_size', default))
+        except ValueError:
+            page_size = default
+        return max(1, min(page_size, settings.SHOP_MAX_PAGE_SIZE))
+
+    def get_keyset_ordering(self):
+        return self.keyset_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        page = keyset_paginate(
+            queryset,
+            self.get_keyset_ordering(),
+            page_size,
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        return self._page_result(page)
+
+    async def apaginate_queryset(self, queryset, page_size):
+        page = await akeyset_paginate(
+            queryset,
+            self.get_keyset_ordering(),
+            page_size,
+            after=self.request.GET.get('after'),
+            before=self.request.GET.get('before'),
+        )
+        return self._page_result(page)
+
+    def _page_result(self, page):
+        page.next_query = self._cursor_query('after', page.next_cursor)
+        page.previous_query = self._cursor_query('before', page.previous_cursor)
+        return None, page, page.object_list, page.has_other_pages()
+
+    def _cursor_query(self, name, cursor):
+        if cursor is None:
+            return ''
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[name] = cursor
+        return params.urlencode()
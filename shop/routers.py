@@ -0,0 +1,52 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_pinned = ContextVar('shop_pinned_to_primary', default=False)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def pinned_to_primary():
+    """Send every read in the block to the primary, e.g. for a request that follows a write."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Writes go to ``default``; reads go to a random alias from
+    ``SHOP_DATABASE_REPLICAS`` unless they happen inside a transaction on the
+    primary or while pinned to it (read-your-own-writes after a mutation).
+    Sessions always stay on the primary: a session written by a login must be
+    readable by the very next request.
+    """
+    primary_apps = {'sessions'}
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.SHOP_DATABASE_REPLICAS
+        if (not replicas or _pinned.get() or model._meta.app_label in self.primary_apps
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.SHOP_DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,116 @@
+"""
+Daily sales rollups. refresh() re-aggregates the days touched since its last
+run into DailyProductSales and DailyBrandSales, so revenue and top-seller
+reports read a few rows per day instead of scanning every order line.
+"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from shop.models import (
+    DailyBrandSales, DailyProductSales, Order, OrderProduct, SalesRollupState, line_total_expression,
+)
+
+BATCH_SIZE = 1000
+
+# SQLite hands back sums of decimals unrounded.
+CENTS = Decimal('0.01')
+
+
+def day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _daily_totals(lines, key, name):
+    return (
+        lines.annotate(day=TruncDate('order__date'))
+        .values_list('day', key, name)
+        .annotate(
+            total_quantity=Sum('quantity'),
+            total_revenue=Sum(line_total_expression(price='price')),
+            orders=Count('order', distinct=True),
+        )
+        .order_by()
+    )
+
+
+def _replace(model, key, name, lines, first_day):
+    model.objects.filter(day__gte=first_day).delete()
+    rows = _daily_totals(lines, key, name).iterator(chunk_size=BATCH_SIZE)
+    created = 0
+    while batch := list(islice(rows, BATCH_SIZE)):
+        model.objects.bulk_create(
+            model(day=day, name=name, quantity=quantity, revenue=revenue, order_count=order_count,
+                  **{f'{key}_id': pk})
+            for day, pk, name, quantity, revenue, order_count in batch
+        )
+        created += len(batch)
+    return created
+
+
+def refresh(rebuild=False, now=None):
+    """
+    Roll up every day from the high-water mark to ``now``. The mark is moved
+    back by SHOP_ROLLUP_LAG to catch orders whose transaction committed after
+    the previous run, and whole days are replaced, so running it again is
+    harmless. ``rebuild`` starts over from the first order. Returns the first
+    and last day rolled up, or None when there is nothing to do.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        # The lock keeps two runs from replacing the same days at once.
+        state, _ = SalesRollupState.objects.select_for_update().get_or_create(pk=1)
+        if rebuild or state.high_water is None:
+            start = Order.objects.aggregate(first=Min('date'))['first']
+            DailyProductSales.objects.all().delete()
+            DailyBrandSales.objects.all().delete()
+        else:
+            start = state.high_water - timedelta(seconds=settings.SHOP_ROLLUP_LAG)
+        state.high_water = now
+        state.save()
+        if start is None or start >= now:
+            return None
+        first_day = timezone.localdate(start)
+        lines = OrderProduct.objects.filter(order__date__gte=day_start(first_day), order__date__lt=now)
+        _replace(DailyProductSales, 'product', 'product__name', lines, first_day)
+        _replace(DailyBrandSales, 'brand', 'product__brand__name', lines.annotate(brand=F('product__brand')),
+                 first_day)
+    return first_day, timezone.localdate(now)
+
+
+def order_deleted(order):
+    # Rolled-up days from this order on no longer match; have the next run redo them.
+    SalesRollupState.objects.filter(high_water__gt=order.date).update(high_water=order.date)
+
+
+def rolled_up_to():
+    return SalesRollupState.objects.values_list('high_water', flat=True).first()
+
+
+def _top(model, key, date_from, date_to, limit):
+    rows = (
+        model.objects.filter(day__gte=date_from, day__lte=date_to)
+        # Live rows show the current name; rows whose product or brand was deleted keep theirs.
+        .values_list(key, Coalesce(f'{key}__name', 'name'))
+        .annotate(total_quantity=Sum('quantity'), total_revenue=Sum('revenue'), orders=Sum('order_count'))
+        .order_by('-total_revenue', key)[:limit]
+    )
+    return [
+        {'id': pk, 'name': name, 'quantity': quantity, 'revenue': revenue.quantize(CENTS), 'order_count': order_count}
+        for pk, name, quantity, revenue, order_count in rows
+    ]
+
+
+def top_products(date_from, date_to, limit=10):
+    """The ``limit`` best-selling products by revenue from ``date_from`` to ``date_to`` (inclusive days)."""
+    return _top(DailyProductSales, 'product', date_from, date_to, limit)
+
+
+def top_brands(date_from, date_to, limit=10):
+    return _top(DailyBrandSales, 'brand', date_from, date_to, limit)
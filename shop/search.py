@@ -0,0 +1,293 @@
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from shop.models import Product
+
+INDEX_TABLE = 'shop_product_fts'
+
+GENERATION_KEY = 'search:generation'
+
+_available = {}
+
+
+def index_available(using=DEFAULT_DB_ALIAS):
+    """
+    True when ``using`` is SQLite with the FTS5 index table in place. Other
+    backends (or SQLite builds without FTS5) use the LIKE based fallback.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    key = _available_key(using)
+    if key not in _available:
+        _available[key] = INDEX_TABLE in connection.introspection.table_names()
+    return _available[key]
+
+
+def _available_key(using):
+    return using, str(connections[using].settings_dict['NAME'])
+
+
+def create_index(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+            "name, description, brand, "
+            "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+        )
+    _available[_available_key(using)] = True
+
+
+def rebuild_index(using=DEFAULT_DB_ALIAS):
+    invalidate_results()
+    if connections[using].vendor != 'sqlite':
+        return 0
+    create_index(using)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {INDEX_TABLE} (rowid, name, description, brand) '
+            'SELECT p.id, p.name, p.description, b.name '
+            'FROM shop_product p INNER JOIN shop_brand b ON b.id = p.brand_id'
+        )
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {INDEX_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def index_product(product, using=DEFAULT_DB_ALIAS):
+    if not index_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [product.pk])
+        cursor.execute(
+            f'INSERT INTO {INDEX_TABLE} (rowid, name, description, brand) VALUES (%s, %s, %s, %s)',
+            [product.pk, product.name, product.description, product.brand.name],
+        )
+
+
+def unindex_product(product_pk, using=DEFAULT_DB_ALIAS):
+    if not index_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [product_pk])
+
+
+def index_brand(brand, using=DEFAULT_DB_ALIAS):
+    if not index_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {INDEX_TABLE} SET brand = %s '
+            'WHERE rowid IN (SELECT id FROM shop_product WHERE brand_id = %s)',
+            [brand.name, brand.pk],
+        )
+
+
+def normalize_query(text):
+    """Casefold, strip accents and collapse whitespace: ' Crème  BRÛLÉE' -> 'creme brulee'."""
+    decomposed = unicodedata.normalize('NFKD', text)
+    stripped = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return ' '.join(stripped.casefold().split())
+
+
+def query_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def search_product_ids(query, using=DEFAULT_DB_ALIAS):
+    """
+    Return the ids of products matching every term of ``query`` (as prefixes),
+    best match first, capped at ``SHOP_SEARCH_MAX_RESULTS``.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return []
+    limit = settings.SHOP_SEARCH_MAX_RESULTS
+    if index_available(using):
+        match = ' '.join(f'"{term}"*' for term in terms)
+        try:
+            with connections[using].cursor() as cursor:
+                cursor.execute(
+                    f'SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s '
+                    f'ORDER BY bm25({INDEX_TABLE}, 10.0, 1.0, 5.0) LIMIT %s',
+                    [match, limit],
+                )
+                return [row[0] for row in cursor.fetchall()]
+        except OperationalError:
+            pass
+    return _fallback_search_ids(terms, using, limit)
+
+
+def _fallback_search_ids(terms, using, limit):
+    condition = Q()
+    name_match = Q()
+    brand_match = Q()
+    for term in terms:
+        name_match &= Q(name__icontains=term)
+        brand_match &= Q(brand__name__icontains=term)
+        condition &= Q(name__icontains=term) | Q(description__icontains=term) | Q(brand__name__icontains=term)
+    qs = (
+        Product.objects.using(using)
+        .filter(condition)
+        .annotate(relevance=Case(
+            When(name_match, then=Value(0)),
+            When(brand_match, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ))
+        .order_by('relevance', 'name', 'pk')
+    )
+    return list(qs.values_list('pk', flat=True)[:limit])
+
+
+class SearchResults:
+    """
+    Lazy, ordered sequence over a ranked id list. Slicing loads just that slice
+    of products in one query, so it can be handed straight to a Paginator.
+    """
+    def __init__(self, ids, queryset=None):
+        self.ids = ids
+        self.queryset = queryset if queryset is not None else Product.objects.all()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __bool__(self):
+        return bool(self.ids)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            ids = self.ids[item]
+            products = self.queryset.in_bulk(ids)
+            return [products[pk] for pk in ids if pk in products]
+        return self[item:item + 1][0]
+
+
+class LRUCache:
+    """Thread-safe in-process mapping holding at most ``max_size`` entries, each for ``timeout`` seconds."""
+    def __init__(self, max_size, timeout):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.timeout)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_results = None
+
+
+def results_cache():
+    global _results
+    if _results is None:
+        _results = LRUCache(settings.SHOP_SEARCH_CACHE_SIZE, settings.SHOP_SEARCH_CACHE_TIMEOUT)
+    return _results
+
+
+def generation():
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        # Start from a random value: if the key is evicted, a fresh counter
+        # cannot land on a generation some process still holds results for.
+        cache.add(GENERATION_KEY, random.randrange(1 << 40), None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+async def ageneration():
+    value = await cache.aget(GENERATION_KEY)
+    if value is None:
+        await cache.aadd(GENERATION_KEY, random.randrange(1 << 40), None)
+        value = await cache.aget(GENERATION_KEY)
+    return value
+
+
+def invalidate_results():
+    """Bump the shared generation so every process stops serving cached result lists."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        generation()
+
+
+def results_key(query, available):
+    """
+    Cache key for ``query``'s results. The FTS5 tokenizer ignores case and
+    accents, so 'Crème' and 'creme' share one entry when the index is
+    ``available``; the icontains fallback only ignores case, so accents stay.
+    """
+    if available:
+        return normalize_query(query)
+    return ' '.join(query.casefold().split())
+
+
+def cached_search_product_ids(query, using=DEFAULT_DB_ALIAS):
+    """
+    search_product_ids() behind a per-process LRU keyed by the normalized query
+    and the current generation, so repeated searches and later pages of the
+    same search reuse the ranked id list.
+    """
+    key = (using, generation(), results_key(query, index_available(using)))
+    ids = results_cache().get(key)
+    if ids is None:
+        ids = tuple(search_product_ids(query, using=using))
+        results_cache().set(key, ids)
+    return ids
+
+
+async def acached_search_product_ids(query, using=DEFAULT_DB_ALIAS):
+    """cached_search_product_ids() for async views; only a cache miss leaves the event loop."""
+    available = connections[using].vendor == 'sqlite' and _available.get(_available_key(using))
+    if available is None:
+        # Looking for the index table is a query; it runs once per database.
+        available = await sync_to_async(index_available)(using)
+    key = (using, await ageneration(), results_key(query, available))
+    ids = results_cache().get(key)
+    if ids is None:
+        # The FTS5 lookup is raw SQL, which has no async API.
+        ids = tuple(await sync_to_async(search_product_ids)(query, using=using))
+        results_cache().set(key, ids)
+    return ids
+
+
+async def aload_products(ids, queryset=None):
+    """The products for ``ids`` in that order, fetched with ``async for``."""
+    queryset = queryset if queryset is not None else Product.objects.all()
+    products = {product.pk: product async for product in queryset.filter(pk__in=ids)}
+    return [products[pk] for pk in ids if pk in products]
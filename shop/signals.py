@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from shop import autocomplete, catalog_cache, sales, search
+from shop.models import Brand, Comment, Order, Product
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw, using, **kwargs):
+    search.index_product(instance, using=using)
+    search.invalidate_results()
+    autocomplete.product_saved(instance)
+    catalog_cache.invalidate_catalog()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, using, **kwargs):
+    search.unindex_product(instance.pk, using=using)
+    search.invalidate_results()
+    autocomplete.product_deleted(instance.pk)
+    catalog_cache.invalidate_catalog()
+
+
+@receiver(post_save, sender=Brand)
+def brand_saved(sender, instance, created, using, **kwargs):
+    if not created:
+        search.index_brand(instance, using=using)
+        search.invalidate_results()
+    autocomplete.brand_saved(instance)
+    catalog_cache.invalidate_catalog()
+
+
+@receiver(post_delete, sender=Brand)
+def brand_deleted(sender, instance, **kwargs):
+    autocomplete.brand_deleted(instance.pk)
+    catalog_cache.invalidate_catalog()
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    catalog_cache.invalidate_product(instance.product_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        Product.objects.comment_added(instance.product_id, instance.date)
+        catalog_cache.invalidate_listing()
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, origin=None, **kwargs):
+    # Deleting a product or brand cascades to its comments; the product row
+    # is going away, so there is no counter left to maintain.
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    if origin_model in (Product, Brand):
+        return
+    Product.objects.comment_removed(instance.product_id)
+    catalog_cache.invalidate_listing()
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite' or not settings.SHOP_SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SHOP_SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    sales.order_deleted(instance)
@@ -0,0 +1,100 @@
+"""
+Static asset pipeline: collectstatic writes content-hashed names, per-page CSS
+bundles and precompressed copies, and StaticFilesMiddleware
+(shop.middleware) serves them with far-future cache headers.
+"""
+import gzip
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Stylesheets each page links, in cascade order. The per-page sheets reuse
+# selectors (body, .btn, form, ...) with different rules, so they can only be
+# bundled page by page, not into one file for the whole site.
+PAGES = ('brand_list', 'cart', 'delete_form', 'form', 'order_detail', 'order_list', 'product_detail',
+         'product_list', 'product_search')
+CSS_BUNDLES = {f'bundles/{page}.css': ('base.css', f'{page}.css') for page in PAGES}
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.html', '.json', '.xml', '.map')
+
+# Skip a compressed copy that saves less than this fraction of the file.
+MIN_SAVING = 0.05
+
+# Preferred first when the client accepts several.
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def bundle_for(names):
+    """The bundle holding exactly ``names`` in that order, if SHOP_BUNDLE_CSS is on and there is one."""
+    if not settings.SHOP_BUNDLE_CSS:
+        return None
+    names = tuple(names)
+    for bundle, sources in CSS_BUNDLES.items():
+        if sources == names:
+            return bundle
+    return None
+
+
+def compress(data):
+    """Return ``{encoding: compressed bytes}`` for the encodings worth serving."""
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in variants.items() if len(body) <= len(data) * (1 - MIN_SAVING)}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also builds CSS_BUNDLES (when
+    SHOP_BUNDLE_CSS is on) before hashing, and writes a ``.gz`` and, with the
+    brotli package installed, a ``.br`` copy of every compressible hashed file.
+    """
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run and settings.SHOP_BUNDLE_CSS:
+            self.build_bundles(paths)
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            for name in set(self.hashed_files.values()):
+                if name.endswith(COMPRESSIBLE):
+                    self.write_compressed(name)
+
+    def build_bundles(self, paths):
+        for bundle, sources in CSS_BUNDLES.items():
+            if not all(source in paths for source in sources):
+                continue
+            parts = []
+            for source in sources:
+                storage, path = paths[source]
+                with storage.open(path) as f:
+                    parts.append(f.read().decode().strip())
+            if self.exists(bundle):
+                self.delete(bundle)
+            self.save(bundle, ContentFile(('\n'.join(parts) + '\n').encode()))
+            paths[bundle] = (self, bundle)
+
+    def write_compressed(self, name):
+        with self.open(name) as f:
+            data = f.read()
+        for encoding, body in compress(data).items():
+            compressed = name + ENCODING_SUFFIXES[encoding]
+            if self.exists(compressed):
+                self.delete(compressed)
+            self.save(compressed, ContentFile(body))
+
+
+def hashed_names(root):
+    """Names listed as hashed in the manifest collectstatic left in ``root``."""
+    manifest = Path(root) / ManifestStaticFilesStorage.manifest_name
+    try:
+        return set(json.loads(manifest.read_text())['paths'].values())
+    except (OSError, ValueError, KeyError):
+        return set()
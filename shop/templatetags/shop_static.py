@@ -0,0 +1,18 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from shop.staticfiles import bundle_for
+
+register = template.Library()
+
+
+@register.simple_tag
+def stylesheets(*names):
+    """Link ``names`` in order, as their single bundle when SHOP_BUNDLE_CSS built one."""
+    bundle = bundle_for(names)
+    if bundle is not None:
+        names = [bundle]
+    return format_html_join(
+        '\n', '<link rel="stylesheet" type="text/css" href="{}">', ((static(name),) for name in names)
+    )
@@ -1,11 +1,34 @@
+import asyncio
+import csv
+import gzip
+import importlib
+import json
+import logging
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
 import pytest
-from django.core.exceptions import ObjectDoesNotExist
-from django.test import Client
-from django.urls import reverse
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed, ObjectDoesNotExist
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import Client, RequestFactory
+from django.urls import include, path, reverse
+from django.utils import timezone
 from pytest_django.asserts import assertTemplateUsed
 
+import Final_project.urls
+import shop.urls
+from shop import async_views, autocomplete, exports, facets, search
 from shop.forms import AddCommentForm
-from shop.models import Comment, CartProduct, Cart, Order, Brand, Product
+from shop.middleware import QueryInstrumentationMiddleware, normalize_sql
+from shop.models import Comment, CartProduct, Cart, Order, OrderProduct, Brand, Product
 
 
 def test_base_view():
@@ -21,7 +44,7 @@ def test_brands_list(brands):
     client = Client()
     response = client.get(url)
     assert response.status_code == 200
-    assert response.context['object_list'].count() == len(brands)
+    assert len(response.context['object_list']) == len(brands)
     for b in brands:
         assert b in response.context['object_list']
 
@@ -70,11 +93,48 @@ def test_products_list(products):
     client = Client()
     response = client.get(url)
     assert response.status_code == 200
-    assert response.context['object_list'].count() == len(products)
+    assert len(response.context['object_list']) == len(products)
     for p in products:
         assert p in response.context['object_list']
 
 
+@pytest.mark.django_db
+def test_products_list_keyset_pages(products):
+    url = reverse('products_list')
+    client = Client()
+    response = client.get(url, {'page_size': 2})
+    page = response.context['page_obj']
+    assert list(response.context['product_list']) == products[:2]
+    assert page.has_next() and not page.has_previous()
+
+    response = client.get(f'{url}?{page.next_query}')
+    page = response.context['page_obj']
+    assert list(response.context['product_list']) == products[2:4]
+    assert page.has_next() and page.has_previous()
+
+    response = client.get(f'{url}?{page.previous_query}')
+    assert list(response.context['product_list']) == products[:2]
+
+
+@pytest.mark.django_db
+def test_products_list_constant_queries(brand, django_assert_num_queries):
+    Product.objects.bulk_create(
+        Product(name=f'p{i}', brand=brand, price=1, description='text') for i in range(60)
+    )
+    facets.get_facets()
+    client = Client()
+    with django_assert_num_queries(1):
+        response = client.get(reverse('products_list'), {'page_size': 50})
+    assert len(response.context['product_list']) == 50
+
+
+@pytest.mark.django_db
+def test_products_list_invalid_cursor():
+    client = Client()
+    response = client.get(reverse('products_list'), {'after': '!!!'})
+    assert response.status_code == 404
+
+
 def test_add_product_get():
     url = reverse('add_product')
     client = Client()
@@ -469,3 +529,1145 @@ def test_delete_product_from_cart(user, create_product, cart):
         assert updated_cart_product is None
     else:
         assert updated_cart_product.quantity == cart_product.quantity - 1
+
+
+@pytest.mark.django_db
+def test_product_search_matches_description_and_brand(brand, create_product):
+    other = Product.objects.create(name='Mouse', brand=Brand.objects.create(name='Logitech'),
+                                   price=10, description='Wireless laptop accessory')
+    client = Client()
+    response = client.get(reverse('product_search'), {'q': 'logitech'})
+    assert response.context['products'] == [other]
+
+    response = client.get(reverse('product_search'), {'q': 'laptop'})
+    assert response.context['products'] == [create_product, other]
+
+
+@pytest.mark.django_db
+def test_product_search_index_follows_writes(brand, create_product):
+    create_product.name = 'Notebook'
+    create_product.save()
+    assert search.search_product_ids('notebook') == [create_product.pk]
+    assert search.search_product_ids('laptop') == [create_product.pk]
+
+    brand.name = 'Lenovo'
+    brand.save()
+    assert search.search_product_ids('lenovo') == [create_product.pk]
+
+    pk = create_product.pk
+    create_product.delete()
+    assert search.search_product_ids('notebook') == []
+    assert pk not in search.search_product_ids('lenovo')
+
+
+@pytest.mark.django_db
+def test_product_search_fallback(monkeypatch, create_product):
+    monkeypatch.setattr(search, 'index_available', lambda using='default': False)
+    assert search.search_product_ids('high quality') == [create_product.pk]
+    assert search.search_product_ids('missing') == []
+
+
+@pytest.mark.django_db
+def test_product_search_paginates(brand):
+    Product.objects.bulk_create(
+        Product(name=f'Phone {i}', brand=brand, price=1, description='text') for i in range(15)
+    )
+    call_command('rebuild_search_index', stdout=StringIO())
+    client = Client()
+    response = client.get(reverse('product_search'), {'q': 'phone', 'page': 2})
+    assert response.context['paginator'].count == 15
+    assert len(response.context['products']) == 5
+
+
+@pytest.mark.django_db
+def test_cart_and_order_totals_in_sql(cart, products):
+    assert Cart.objects.with_total().get(pk=cart.pk).get_total() == '102.90'
+    assert cart.get_total() == '102.90'
+    lines = list(cart.cartproduct_set.with_totals())
+    assert [line.total() for line in lines] == [Decimal('20.58')] * len(products)
+
+    order = Order.objects.create(user=cart.user)
+    OrderProduct.objects.create(order=order, product=products[0], quantity=3, name='i', price=products[0].price)
+    order.refresh_totals()
+    assert Order.objects.get(pk=order.pk).total() == '30.87'
+    assert order.item_count == 3
+
+
+@pytest.mark.django_db
+def test_show_cart_constant_queries(cart, brand, django_assert_num_queries):
+    client = Client()
+    client.force_login(cart.user)
+    # The session comes from the cache; the user is loaded on every request.
+    with django_assert_num_queries(3):
+        client.get(reverse('cart'))
+    for i in range(20):
+        product = Product.objects.create(name=f'extra {i}', brand=brand, price=1, description='text')
+        CartProduct.objects.create(cart=cart, product=product)
+    with django_assert_num_queries(3):
+        response = client.get(reverse('cart'))
+    assert response.context['cart'].get_total() == '122.90'
+
+
+@pytest.mark.django_db
+def test_order_detail_constant_queries(create_order, products, django_assert_num_queries):
+    for product in products:
+        OrderProduct.objects.create(order=create_order, product=product, quantity=2,
+                                    name=product.name, price=product.price)
+    create_order.refresh_totals()
+    client = Client()
+    client.force_login(create_order.user)
+    with django_assert_num_queries(4):
+        response = client.get(reverse('order_detail', args=(create_order.pk,)))
+    assert response.context['object'].total() == '102.90'
+    assert len(response.context['items']) == len(products)
+
+
+@pytest.mark.django_db
+def test_add_to_cart_increments_in_place(products, user, django_assert_max_num_queries):
+    client = Client()
+    client.force_login(user)
+    url = reverse('add_to_cart', args=(products[0].pk,))
+    client.post(url)
+    with django_assert_max_num_queries(3):
+        client.post(url)
+    assert CartProduct.objects.get(cart__user=user, product=products[0]).quantity == 2
+
+
+@pytest.mark.django_db
+def test_first_add_to_cart_checks_product_with_the_cart(user, create_product, django_assert_num_queries):
+    cart = Cart.objects.create(user=user)
+    # Update (no line yet), cart id with the product check, insert in a savepoint.
+    with django_assert_num_queries(5) as captured:
+        assert CartProduct.objects.increment(user, create_product.pk)
+    assert [query['sql'].split()[0] for query in captured] == ['UPDATE', 'SELECT', 'SAVEPOINT', 'INSERT', 'RELEASE']
+    with django_assert_num_queries(2):
+        assert not CartProduct.objects.increment(user, 12345)
+    assert cart.cartproduct_set.get().quantity == 1
+
+
+@pytest.mark.django_db
+def test_add_missing_product_to_cart(user):
+    client = Client()
+    client.force_login(user)
+    response = client.post(reverse('add_to_cart', args=(12345,)))
+    assert response.status_code == 404
+    assert not CartProduct.objects.exists()
+
+
+@pytest.mark.django_db
+def test_delete_last_unit_from_cart(user, create_product, cart):
+    CartProduct.objects.create(product=create_product, cart=cart, quantity=1)
+    client = Client()
+    client.force_login(user)
+    client.post(reverse('delete_from_cart', args=(create_product.pk,)))
+    assert not CartProduct.objects.filter(product=create_product, cart=cart).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_cart_increments(products, user):
+    threads, clicks = 8, 10
+
+    def click():
+        try:
+            for _ in range(clicks):
+                # The shared-cache in-memory test database reports contention as
+                # "table is locked" instead of waiting, so retry those clicks.
+                while True:
+                    try:
+                        CartProduct.objects.increment(user, products[0].pk)
+                        break
+                    except OperationalError:
+                        time.sleep(0.001)
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=click) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert CartProduct.objects.get(cart__user=user, product=products[0]).quantity == threads * clicks
+
+
+@pytest.mark.django_db
+def test_create_order_snapshots_lines(cart, products, brand, django_assert_max_num_queries):
+    for i in range(50):
+        product = Product.objects.create(name=f'extra {i}', brand=brand, price=2, description='text')
+        CartProduct.objects.create(cart=cart, product=product)
+    client = Client()
+    client.force_login(cart.user)
+    with django_assert_max_num_queries(10):
+        client.post(reverse('create_order'))
+    order = Order.objects.get(user=cart.user)
+    assert order.orderproduct_set.count() == 55
+    assert not cart.cartproduct_set.exists()
+
+    products[0].name = 'renamed'
+    products[0].price = 99
+    products[0].save()
+    line = order.orderproduct_set.get(product=products[0])
+    assert (line.name, line.price, line.quantity) == ('i', Decimal('10.29'), 2)
+    assert order.total() == '202.90'
+    assert order.item_count == 60
+
+
+@pytest.mark.django_db
+def test_create_order_rolls_back_on_failure(cart, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('boom')
+
+    monkeypatch.setattr(OrderProduct.objects, 'bulk_create', fail)
+    with pytest.raises(RuntimeError):
+        Order.objects.create_from_cart(cart.user)
+    assert not Order.objects.exists()
+    assert cart.cartproduct_set.count() == 5
+
+
+@pytest.mark.django_db
+def test_order_list_keyset_pages(user, django_assert_num_queries):
+    Order.objects.bulk_create(Order(user=user, total_amount=i) for i in range(30))
+    client = Client()
+    client.force_login(user)
+    with django_assert_num_queries(2):
+        response = client.get(reverse('order_list'), {'page_size': 20})
+    first = response.context['object_list']
+    assert len(first) == 20
+    assert [o.pk for o in first] == sorted((o.pk for o in first), reverse=True)
+
+    response = client.get(f"{reverse('order_list')}?{response.context['page_obj'].next_query}")
+    second = response.context['object_list']
+    assert len(second) == 10
+    assert not response.context['page_obj'].has_next()
+    assert {o.pk for o in first}.isdisjoint(o.pk for o in second)
+
+
+@pytest.mark.django_db
+def test_sql_instrumentation_headers(products, settings):
+    settings.SHOP_SQL_INSTRUMENTATION = True
+    facets.get_facets()
+    client = Client()
+    response = client.get(reverse('products_list'))
+    assert response['X-DB-Query-Count'] == '1'
+    assert response['X-DB-Duplicate-Queries'] == '0'
+    assert response['Server-Timing'].startswith('db;desc="1 queries";dur=')
+
+
+def test_sql_instrumentation_disabled_by_default():
+    with pytest.raises(MiddlewareNotUsed):
+        QueryInstrumentationMiddleware(lambda request: None)
+
+
+@pytest.mark.django_db
+def test_sql_instrumentation_flags_n_plus_one(products, comments, settings, caplog):
+    settings.SHOP_SQL_INSTRUMENTATION = True
+    settings.SHOP_NPLUSONE_THRESHOLD = 3
+
+    def view(request):
+        names = [comment.product.name for comment in Comment.objects.all()]
+        return HttpResponse(' '.join(names))
+
+    middleware = QueryInstrumentationMiddleware(view)
+    with caplog.at_level(logging.INFO, logger='shop.sql'):
+        response = middleware(RequestFactory().get('/'))
+    assert response['X-DB-Query-Count'] == '6'
+    assert response['X-DB-Duplicate-Queries'] == '1'
+    warning = json.loads([r for r in caplog.records if r.levelno == logging.WARNING][0].getMessage())
+    assert warning['event'] == 'n_plus_one'
+    assert warning['count'] == 5
+    assert warning['sql'].startswith('SELECT "shop_product"')
+    assert warning['python'].startswith('shop/tests.py:')
+
+
+def test_normalize_sql():
+    assert normalize_sql("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'") == \
+        'SELECT * FROM t WHERE id IN (...) AND name = ?'
+    assert normalize_sql('SELECT * FROM t WHERE id IN (%s, %s)') == 'SELECT * FROM t WHERE id IN (...)'
+
+
+@pytest.mark.django_db(transaction=True)
+def test_generate_catalog_and_benchmark(settings):
+    settings.SHOP_COMPRESS_RESPONSES = True
+    call_command('generate_catalog', brands=3, products=40, comments_per_product=1, users=2,
+                 cart_lines=2, orders_per_user=3, lines_per_order=2, batch_size=7, stdout=StringIO())
+    assert Product.objects.count() == 40
+    assert Order.objects.count() == 6
+    assert Order.objects.filter(item_count__gt=0, total_amount__gt=0).count() == 6
+    assert len(search.search_product_ids('1')) >= 1
+
+    out = StringIO()
+    call_command('benchmark', 'products_list', 'order_list', requests=4, concurrency=1, host='testserver',
+                 stdout=out)
+    report = json.loads(out.getvalue())
+    assert set(report['results']) == {'products_list', 'order_list'}
+    for result in report['results'].values():
+        assert result['requests'] == 4
+        assert result['errors'] == 0
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+        assert result['compression']['ratio'] > 1
+        assert result['bytes_per_response'] < result['compression']['original_bytes_per_response']
+
+
+@pytest.mark.django_db
+def test_catalog_pages_served_from_cache(products, comments, django_assert_num_queries):
+    client = Client()
+    urls = [reverse('products_list'), reverse('brands_list'), reverse('detail_product', args=(products[0].pk,))]
+    for url in urls:
+        client.get(url)
+    for url in urls:
+        with django_assert_num_queries(0):
+            assert client.get(url).status_code == 200
+
+
+@pytest.mark.django_db
+def test_catalog_cache_invalidated_by_writes(user, products, comments):
+    client = Client()
+    detail = reverse('detail_product', args=(products[0].pk,))
+    client.get(reverse('products_list'))
+    client.get(detail)
+
+    products[0].name = 'Renamed product'
+    products[0].save()
+    assert 'Renamed product' in client.get(reverse('products_list')).content.decode()
+    assert 'Renamed product' in client.get(detail).content.decode()
+
+    products[0].brand.name = 'Renamed brand'
+    products[0].brand.save()
+    assert 'Renamed brand' in client.get(reverse('products_list')).content.decode()
+
+    Comment.objects.create(product=products[0], user=user, text='fresh comment')
+    assert 'fresh comment' in client.get(detail).content.decode()
+    comments[0].delete()
+    assert len(client.get(detail).context['comments']) == len(comments)
+
+
+@pytest.mark.django_db
+def test_cached_listing_follows_comment_counters(user, products, comments):
+    client = Client()
+    url = reverse('products_list')
+
+    def popular():
+        return [(p.pk, p.comment_count) for p in client.get(url, {'sort': 'popular'}).context['product_list']]
+
+    assert popular()[0] == (products[0].pk, len(comments))
+    for i in range(len(comments) + 1):
+        Comment.objects.create(product=products[3], user=user, text=f'c{i}')
+    assert popular()[0] == (products[3].pk, len(comments) + 1)
+    assert f'<td>{len(comments) + 1}</td>' in client.get(url).content.decode()
+    Comment.objects.filter(product=products[3]).first().delete()
+    # Tied on comments; the newer product sorts first.
+    assert popular()[:2] == [(products[3].pk, len(comments)), (products[0].pk, len(comments))]
+
+
+@pytest.mark.django_db
+def test_cached_catalog_keeps_per_user_bits(user, products, comments):
+    client = Client()
+    detail = reverse('detail_product', args=(products[0].pk,))
+    assert 'btn-danger' not in client.get(detail).content.decode()
+    client.force_login(user)
+    content = client.get(detail).content.decode()
+    assert content.count('btn-danger') == len(comments)
+    assert 'csrfmiddlewaretoken' in content
+
+
+@pytest.mark.django_db
+def test_detail_product_shows_newest_comments_page(user, products, settings, django_assert_num_queries):
+    settings.SHOP_COMMENTS_PAGE_SIZE = 3
+    created = [Comment.objects.create(product=products[0], user=user, text=f'c{i}') for i in range(7)]
+    client = Client()
+    with django_assert_num_queries(3):
+        response = client.get(reverse('detail_product', args=(products[0].pk,)))
+    assert response.context['comments'] == created[:-4:-1]
+    more_url = response.context['more_comments_url']
+
+    with django_assert_num_queries(1):
+        response = client.get(more_url)
+    assertTemplateUsed(response, 'shop/comment_list.html')
+    assert list(response.context['comments']) == created[3:0:-1]
+
+    response = client.get(response.context['more_comments_url'])
+    assert list(response.context['comments']) == created[:1]
+    assert 'more_comments_url' not in response.context
+
+
+@pytest.mark.django_db
+def test_comment_counters_follow_views(user, products, comments):
+    product = products[0]
+    product.refresh_from_db()
+    assert product.comment_count == len(comments)
+    assert product.last_comment_at == comments[-1].date
+
+    client = Client()
+    client.force_login(user)
+    client.post(reverse('add_comment', args=(product.pk,)), {'text': 'newest'})
+    newest = Comment.objects.get(text='newest')
+    product.refresh_from_db()
+    assert product.comment_count == len(comments) + 1
+    assert product.last_comment_at == newest.date
+
+    client.post(reverse('delete_comment', args=(newest.pk,)))
+    product.refresh_from_db()
+    assert product.comment_count == len(comments)
+    assert product.last_comment_at == comments[-1].date
+
+
+@pytest.mark.django_db
+def test_comment_counters_on_cascade_and_reconcile(user, products, comments):
+    products[0].delete()
+    Comment.objects.create(product=products[1], user=user, text='one')
+    Product.objects.filter(pk=products[2].pk).update(comment_count=7)
+    Product.objects.filter(pk=products[1].pk).update(last_comment_at=None)
+
+    out = StringIO()
+    call_command('reconcile_comment_counts', batch_size=2, stdout=out)
+    assert 'Repaired 2 drifted' in out.getvalue()
+    assert list(Product.objects.order_by('pk').values_list('comment_count', flat=True)) == [1, 0, 0, 0]
+    assert Product.objects.get(pk=products[1].pk).last_comment_at is not None
+
+
+@pytest.mark.django_db
+def test_products_list_sorted_by_popularity(user, products, django_assert_num_queries):
+    for i, product in enumerate(products[:3]):
+        for _ in range(i + 1):
+            Comment.objects.create(product=product, user=user, text='c')
+    facets.get_facets()
+    client = Client()
+    with django_assert_num_queries(1) as captured:
+        response = client.get(reverse('products_list'), {'sort': 'popular', 'page_size': 2})
+    assert 'COUNT' not in captured.captured_queries[0]['sql']
+    assert response.context['product_list'] == [products[2], products[1]]
+    response = client.get(reverse('products_list') + '?' + response.context['page_obj'].next_query)
+    assert response.context['product_list'] == [products[0], products[4]]
+
+    response = client.get(reverse('products_list'), {'sort': 'recently_discussed'})
+    assert response.context['product_list'] == [products[2], products[1], products[0]]
+
+
+@pytest.mark.django_db
+def test_products_list_filters(brands):
+    cheap = Product.objects.create(name='cheap', brand=brands[0], price=10, for_whom=2, description='text')
+    mid = Product.objects.create(name='mid', brand=brands[1], price=60, for_whom=3, description='text')
+    pricey = Product.objects.create(name='pricey', brand=brands[1], price=300, for_whom=2, description='text')
+    client = Client()
+
+    def listed(**params):
+        return client.get(reverse('products_list'), params).context['product_list']
+
+    assert listed(brand=brands[1].pk) == [mid, pricey]
+    assert listed(for_whom=[2, 3], brand=[brands[0].pk, brands[1].pk]) == [cheap, mid, pricey]
+    assert listed(for_whom=2, price_band='250-') == [pricey]
+    assert listed(min_price='50', max_price='100') == [mid]
+    # Unknown values are ignored rather than failing the page.
+    assert listed(brand='999', for_whom='x', min_price='cheap') == [cheap, mid, pricey]
+
+
+@pytest.mark.django_db
+def test_facet_counts_follow_catalog_writes(brands, settings, django_assert_num_queries):
+    product = Product.objects.create(name='p', brand=brands[0], price=10, for_whom=2, description='text')
+    facets.get_facets()
+
+    Product.objects.create(name='q', brand=brands[1], price=60, for_whom=3, description='text')
+    product.brand = brands[1]
+    product.price = 300
+    product.save()
+    renamed = brands[2]
+    renamed.name = 'Renamed'
+    renamed.save()
+    brands[4].delete()
+
+    client = Client()
+    # Writes bump the catalog version: brand counts and bucket totals are aggregated again, once.
+    with django_assert_num_queries(3):
+        groups = client.get(reverse('products_list')).context['facet_groups']
+    with django_assert_num_queries(0):
+        client.get(reverse('products_list'))
+    assert facets.get_facets() == facets.build_facets()
+    assert facets.get_facets()['brands'][renamed.pk] == {'name': 'Renamed', 'count': 0}
+    assert [(link['label'], link['count']) for link in groups[0][1]] == [(brands[1].name, 2)]
+    assert [link['count'] for link in groups[1][1]] == [0, 1, 1]
+    assert [link['count'] for link in groups[2][1]] == [0, 0, 1, 0, 1]
+
+    # Bands changed in the settings but missing from the cached counts show as empty.
+    settings.SHOP_PRICE_BANDS = [*settings.SHOP_PRICE_BANDS, 1000]
+    groups = client.get(reverse('products_list'), {'sort': 'popular'}).context['facet_groups']
+    assert [link['count'] for link in groups[2][1]] == [0, 0, 1, 0, 0, 0]
+
+
+def test_normalize_query():
+    assert search.normalize_query('  Crème\tBRÛLÉE  ') == 'creme brulee'
+
+
+@pytest.mark.django_db
+def test_autocomplete_prefix_suggestions(brand, django_assert_num_queries):
+    brand.name = 'Élan Parfums'
+    brand.save()
+    amber = Product.objects.create(name='Amber Noir', brand=brand, price=10, description='text')
+    popular = Product.objects.create(name='Amber Rose', brand=brand, price=10, description='text')
+    Product.objects.filter(pk=popular.pk).update(comment_count=3)
+    Product.objects.create(name='Citrus', brand=brand, price=10, description='text')
+    client = Client()
+    url = reverse('product_autocomplete')
+
+    response = client.get(url, {'q': 'amb'})
+    assert [item['label'] for item in response.json()['suggestions']] == ['Amber Rose', 'Amber Noir']
+    with django_assert_num_queries(0):
+        response = client.get(url, {'q': ' NOI'})
+    assert response.json()['suggestions'] == [
+        {'type': 'product', 'id': amber.pk, 'label': 'Amber Noir', 'url': amber.get_absolute_url()},
+    ]
+    assert client.get(url, {'q': 'elan'}).json()['suggestions'][0]['type'] == 'brand'
+    assert client.get(url, {'q': ''}).json()['suggestions'] == []
+
+    amber.name = 'Velvet Oud'
+    amber.save()
+    Product.objects.get(name='Citrus').delete()
+    with django_assert_num_queries(0):
+        assert client.get(url, {'q': 'noir'}).json()['suggestions'] == []
+        assert client.get(url, {'q': 'cit'}).json()['suggestions'] == []
+        assert client.get(url, {'q': 'oud'}).json()['suggestions'][0]['id'] == amber.pk
+
+
+def test_autocomplete_index_is_bounded():
+    index = autocomplete.PrefixIndex(max_entries=3)
+    assert index.add('product', 1, 'Amber Noir', '/1')
+    assert not index.add('product', 2, 'Blue Musk', '/2')
+    assert len(index) == 2
+    index.remove('product', 1)
+    assert index.add('product', 2, 'Blue Musk', '/2')
+    assert [item['id'] for item in index.suggest('musk', 5)] == [2]
+
+
+def test_autocomplete_build_ranks_whole_prefix_range():
+    items = [('product', pk, f'Amber {pk:03}', f'/{pk}', pk == 150) for pk in range(200)]
+    index = autocomplete.PrefixIndex.build(1000, [('brand', 1, 'Amberline', '/b1', 0), *items])
+    assert index.entries == sorted(index.entries)
+    # The best product sorts after the first limit * 10 keys.
+    assert [item['id'] for item in index.suggest('amber', 3)] == [1, 150, 0]
+    assert len(autocomplete.PrefixIndex.build(5, items)) == 4
+
+
+def test_autocomplete_short_prefixes_are_ranked_ahead():
+    items = [('product', pk, f'Amber {pk:03}', f'/{pk}', pk % 7) for pk in range(50)]
+    index = autocomplete.PrefixIndex.build(1000, items, top_size=3)
+    assert set(index.top) == {'a', 'am', '0', '00', '01', '02', '03', '04'}
+    assert [item['id'] for item in index.suggest('a', 3)] == [6, 13, 20]
+    # Writes re-rank the short prefixes they touch.
+    index.add('product', 99, 'Ambrette', '/99', 10)
+    assert [item['id'] for item in index.suggest('am', 2)] == [99, 6]
+    index.remove('product', 99)
+    assert [item['id'] for item in index.suggest('a', 2)] == [6, 13]
+    # Longer lists than were ranked ahead come from the whole range.
+    assert len(index.suggest('a', 10)) == 10
+
+
+def test_autocomplete_refreshes_in_background(settings, monkeypatch):
+    settings.SHOP_AUTOCOMPLETE_REFRESH = 0
+    old = autocomplete.PrefixIndex.build(100, [('product', 1, 'Amber', '/1', 0)])
+    monkeypatch.setattr(autocomplete, '_index', old)
+
+    def build_index():
+        # A delete signalled while the rebuild runs is replayed onto its result.
+        autocomplete.product_deleted(2)
+        return autocomplete.PrefixIndex.build(100, [('product', 2, 'Amber Noir', '/2', 0),
+                                                    ('product', 3, 'Amber Oud', '/3', 0)])
+
+    monkeypatch.setattr(autocomplete, 'build_index', build_index)
+    assert autocomplete.get_index() is old
+    for thread in threading.enumerate():
+        if thread.name == 'autocomplete-refresh':
+            thread.join()
+    assert [item['id'] for item in autocomplete.get_index().suggest('amber', 5)] == [3]
+
+
+@pytest.mark.django_db
+def test_search_results_cached_per_normalized_query(brand, django_assert_num_queries):
+    Product.objects.bulk_create(
+        Product(name=f'Crème {i}', brand=brand, price=1, description='text') for i in range(15)
+    )
+    search.rebuild_index()
+    client = Client()
+    url = reverse('product_search')
+    first = client.get(url, {'q': 'creme'}).context['products']
+    with django_assert_num_queries(1):
+        response = client.get(url, {'q': '  CRÈME '})
+    assert response.context['products'] == first
+    with django_assert_num_queries(1):
+        response = client.get(url, {'q': 'Creme', 'page': 2})
+    assert len(response.context['products']) == 5
+
+    product = Product.objects.create(name='Crème brûlée', brand=brand, price=1, description='text')
+    assert product in client.get(url, {'q': 'brulee'}).context['products']
+    product.delete()
+    assert not client.get(url, {'q': 'brulee'}).context['products']
+
+
+@pytest.mark.django_db
+def test_search_fallback_keeps_accents(brand, monkeypatch):
+    monkeypatch.setattr(search, 'index_available', lambda using='default': False)
+    creme = Product.objects.create(name='Crème brûlée', brand=brand, price=1, description='text')
+    plain = Product.objects.create(name='Creme fraiche', brand=brand, price=1, description='text')
+    client = Client()
+    url = reverse('product_search')
+    assert client.get(url, {'q': 'Crème'}).context['products'] == [creme]
+    # Same key as 'Crème' on the FTS5 path, a separate one for icontains.
+    assert client.get(url, {'q': 'creme'}).context['products'] == [plain]
+    assert client.get(url, {'q': ' CRÈME '}).context['products'] == [creme]
+
+
+def test_search_lru_cache_evicts_and_expires(monkeypatch):
+    lru = search.LRUCache(max_size=2, timeout=10)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1
+    lru.set('c', 3)
+    assert lru.get('b') is None
+    assert (lru.get('a'), lru.get('c')) == (1, 3)
+    now = time.monotonic()
+    monkeypatch.setattr(search.time, 'monotonic', lambda: now + 11)
+    assert lru.get('a') is None
+    assert len(lru) == 1
+
+
+@pytest.mark.django_db
+def test_sqlite_pragmas_applied_on_connect(settings):
+    from shop.signals import configure_sqlite
+    settings.SHOP_SQLITE_PRAGMAS = {'busy_timeout': 1234, 'cache_size': -2000}
+    configure_sqlite(sender=connection.__class__, connection=connection)
+    with connection.cursor() as cursor:
+        assert cursor.execute('PRAGMA busy_timeout').fetchone()[0] == 1234
+        assert cursor.execute('PRAGMA cache_size').fetchone()[0] == -2000
+
+
+def load_production_settings(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    import Final_project.settings_production as module
+    return importlib.reload(module)
+
+
+def test_production_settings_profile(monkeypatch):
+    monkeypatch.setenv('DJANGO_SECRET_KEY', 'secret')
+    prod = load_production_settings(monkeypatch, DB_NAME='/tmp/shop.sqlite3', SQLITE_BUSY_TIMEOUT='2000',
+                                    DJANGO_ALLOWED_HOSTS='shop.example, www.shop.example')
+    assert prod.DEBUG is False
+    assert prod.ALLOWED_HOSTS == ['shop.example', 'www.shop.example']
+    database = prod.DATABASES['default']
+    assert (database['NAME'], database['CONN_MAX_AGE'], database['CONN_HEALTH_CHECKS']) == ('/tmp/shop.sqlite3', 600, True)
+    assert database['OPTIONS'] == {'timeout': 2.0}
+    assert prod.SHOP_SQLITE_PRAGMAS['journal_mode'] == 'WAL'
+    assert prod.SHOP_SQLITE_PRAGMAS['busy_timeout'] == 2000
+
+    prod = load_production_settings(monkeypatch, DB_ENGINE='postgresql', DB_NAME='shop', DB_PGBOUNCER='1')
+    database = prod.DATABASES['default']
+    assert database['ENGINE'] == 'django.db.backends.postgresql'
+    assert database['DISABLE_SERVER_SIDE_CURSORS'] is True
+    # Without a shared cache, sessions and users are not cached across workers.
+    assert prod.SESSION_ENGINE == 'django.contrib.sessions.backends.db'
+    assert prod.SHOP_USER_CACHE_TIMEOUT == 0
+
+    with pytest.raises(ImproperlyConfigured):
+        load_production_settings(monkeypatch, DB_ENGINE='oracle')
+
+    prod = load_production_settings(monkeypatch, DB_ENGINE='sqlite', REDIS_URL='redis://cache:6379/0')
+    assert prod.CACHES['default']['BACKEND'] == 'django.core.cache.backends.redis.RedisCache'
+    assert prod.SESSION_ENGINE == 'django.contrib.sessions.backends.cached_db'
+    assert prod.SHOP_USER_CACHE_TIMEOUT == 300
+    prod = load_production_settings(monkeypatch, SESSION_BACKEND='signed_cookies')
+    assert prod.SESSION_ENGINE == 'django.contrib.sessions.backends.signed_cookies'
+    with pytest.raises(ImproperlyConfigured):
+        load_production_settings(monkeypatch, SESSION_BACKEND='file')
+    monkeypatch.delenv('DJANGO_SECRET_KEY')
+    with pytest.raises(ImproperlyConfigured):
+        load_production_settings(monkeypatch, DB_ENGINE='sqlite')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replica_router(settings):
+    from django.contrib.sessions.models import Session
+    from django.db import transaction
+    from shop.routers import PrimaryReplicaRouter, pinned_to_primary
+    router = PrimaryReplicaRouter()
+    assert router.db_for_read(Product) == 'default'
+
+    settings.SHOP_DATABASE_REPLICAS = ['replica_1']
+    assert router.db_for_read(Product) == 'replica_1'
+    assert router.db_for_write(Product) == 'default'
+    assert router.db_for_read(Session) == 'default'
+    with pinned_to_primary():
+        assert router.db_for_read(Product) == 'default'
+    with transaction.atomic():
+        assert router.db_for_read(Product) == 'default'
+    assert router.db_for_read(Product) == 'replica_1'
+    assert router.allow_migrate('replica_1', 'shop') is False
+    assert router.allow_migrate('default', 'shop') is None
+
+
+def test_replica_pinning_middleware(settings):
+    from shop.middleware import ReplicaPinningMiddleware
+    from shop.routers import PrimaryReplicaRouter
+    settings.SHOP_DATABASE_REPLICAS = ['replica_1']
+    seen = []
+
+    def view(request):
+        seen.append(PrimaryReplicaRouter().db_for_read(Product))
+        return HttpResponse()
+
+    middleware = ReplicaPinningMiddleware(view)
+    factory = RequestFactory()
+    assert middleware(factory.get('/')).cookies == {}
+    response = middleware(factory.post('/'))
+    cookie = response.cookies[ReplicaPinningMiddleware.cookie_name]
+    assert cookie['max-age'] == settings.SHOP_REPLICA_PIN_SECONDS
+    request = factory.get('/')
+    request.COOKIES[ReplicaPinningMiddleware.cookie_name] = '1'
+    middleware(request)
+    assert seen == ['replica_1', 'default', 'default']
+
+    async def async_view(request):
+        return view(request)
+
+    middleware = ReplicaPinningMiddleware(async_view)
+    assert asyncio.iscoroutinefunction(middleware)
+    response = async_to_sync(middleware)(factory.post('/'))
+    assert ReplicaPinningMiddleware.cookie_name in response.cookies
+    assert async_to_sync(middleware)(factory.get('/')).cookies == {}
+    assert seen[3:] == ['default', 'replica_1']
+
+    settings.SHOP_DATABASE_REPLICAS = []
+    with pytest.raises(MiddlewareNotUsed):
+        ReplicaPinningMiddleware(view)
+
+
+ASYNC_CATALOG_VIEWS = {
+    'brands_list': async_views.AsyncBrandsListView,
+    'products_list': async_views.AsyncProductListView,
+    'detail_product': async_views.AsyncDetailProductView,
+    'product_search': async_views.AsyncProductSearchView,
+}
+async_shop_urlpatterns = [
+    path(str(pattern.pattern), ASYNC_CATALOG_VIEWS[pattern.name].as_view(), name=pattern.name)
+    if pattern.name in ASYNC_CATALOG_VIEWS else pattern
+    for pattern in shop.urls.urlpatterns
+]
+# Test URLconf: the whole site, with the catalog served by shop.async_views.
+urlpatterns = [
+    path('shop/', include(async_shop_urlpatterns)) if getattr(pattern, 'urlconf_name', None) is shop.urls
+    else pattern
+    for pattern in Final_project.urls.urlpatterns
+]
+
+
+@pytest.fixture
+def async_catalog_views(settings):
+    settings.SHOP_ASYNC_VIEWS = True
+    settings.ROOT_URLCONF = __name__
+
+
+def catalog_contexts(client, product):
+    responses = [
+        client.get(reverse('products_list'), {'sort': 'popular', 'brand': product.brand_id}),
+        client.get(reverse('brands_list')),
+        client.get(reverse('detail_product', args=(product.pk,))),
+        client.get(reverse('product_search'), {'q': 'i'}),
+    ]
+    assert [response.status_code for response in responses] == [200] * 4
+    return [
+        list(responses[0].context['object_list']),
+        list(responses[0].context['facet_groups']),
+        list(responses[1].context['object_list']),
+        (responses[2].context['object'], list(responses[2].context['comments'])),
+        list(responses[3].context['object_list']),
+    ]
+
+
+@pytest.mark.django_db
+def test_async_catalog_views_match_sync(user, products, comments, request):
+    search.rebuild_index()
+    client = Client()
+    client.force_login(user)
+    expected = catalog_contexts(client, products[0])
+
+    request.getfixturevalue('async_catalog_views')
+    cache.clear()
+    response = client.get(reverse('products_list'))
+    assert asyncio.iscoroutinefunction(response.resolver_match.func.view_class.get)
+    assert catalog_contexts(client, products[0]) == expected
+    # Second pass is served from the cache.
+    assert catalog_contexts(client, products[0]) == expected
+    assert client.get(reverse('detail_product', args=(products[-1].pk + 100,))).status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_asgi_benchmark(products, async_catalog_views):
+    search.rebuild_index()
+    out = StringIO()
+    call_command('benchmark', asgi=True, requests=8, concurrency=4, stdout=out)
+    report = json.loads(out.getvalue())
+    assert report['async_views'] is True
+    assert set(report['results']) == {'products_list', 'brands_list', 'detail_product', 'product_search'}
+    assert all(result['errors'] == 0 for result in report['results'].values())
+
+
+@pytest.mark.django_db
+def test_order_export_view(user, superuser, cart, create_order):
+    Order.objects.create_from_cart(user)
+    Order.objects.create_from_cart(superuser)
+    client = Client()
+    url = reverse('order_export')
+    client.force_login(user)
+    assert client.get(url).status_code == 403
+
+    client.force_login(superuser)
+    response = client.get(url)
+    assert response.streaming
+    assert response['Content-Type'] == 'text/csv'
+    assert response['Content-Disposition'] == 'attachment; filename="orders.csv"'
+    rows = list(csv.reader(StringIO(b''.join(response.streaming_content).decode())))
+    assert rows[0][:3] == ['order_id', 'date', 'user_id']
+    # The empty order keeps a row; the cart's five lines follow.
+    assert [row[0] for row in rows[1:]] == [str(create_order.pk)] + [str(create_order.pk + 1)] * 5
+    assert rows[2][7:] == ['i', '2', '10.29', '20.58']
+
+    response = client.get(url, {'format': 'jsonl', 'user': 'user', 'date_from': '2000-01-01',
+                                'date_to': timezone.localdate().isoformat()})
+    assert response['Content-Type'] == 'application/x-ndjson'
+    orders = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert [len(order['lines']) for order in orders] == [0, 5]
+    assert orders[1]['total_amount'] == '102.90'
+
+    tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+    assert b''.join(client.get(url, {'format': 'jsonl', 'date_from': tomorrow}).streaming_content) == b''
+    assert client.get(url, {'date_from': tomorrow, 'date_to': '2000-01-01'}).status_code == 400
+    assert client.get(url, {'format': 'xml'}).status_code == 400
+
+
+@pytest.mark.django_db
+def test_export_orders_command(user, products, tmp_path, django_assert_num_queries):
+    cart = Cart.objects.create(user=user)
+    for _ in range(5):
+        cart.cartproduct_set.create(product=products[0], quantity=1)
+        Order.objects.create_from_cart(user)
+    path = tmp_path / 'orders.csv'
+    # One streamed query for the orders plus one line prefetch per chunk of two.
+    with django_assert_num_queries(4):
+        call_command('export_orders', chunk_size=2, output=str(path))
+    assert len(path.read_text().splitlines()) == 6
+
+    out = StringIO()
+    call_command('export_orders', format='jsonl', user='nobody', stdout=out)
+    assert out.getvalue() == ''
+
+
+@pytest.mark.django_db
+def test_export_chunks_stay_under_the_sqlite_variable_limit(user, products, monkeypatch, django_assert_num_queries):
+    cart = Cart.objects.create(user=user)
+    for _ in range(5):
+        cart.cartproduct_set.create(product=products[0], quantity=1)
+        Order.objects.create_from_cart(user)
+    monkeypatch.setattr(exports, 'MAX_CHUNK_SIZE', 2)
+    # A larger chunk size is capped, so each line query binds at most two ids.
+    with django_assert_num_queries(4):
+        assert len(list(exports.iterate(exports.orders_for_export(), chunk_size=1000))) == 5
+
+
+def place_order(user, product, quantity, date):
+    cart, _ = Cart.objects.get_or_create(user=user)
+    cart.cartproduct_set.create(product=product, quantity=quantity)
+    order = Order.objects.create_from_cart(user)
+    Order.objects.filter(pk=order.pk).update(date=date)
+    order.date = date
+    return order
+
+
+@pytest.mark.django_db
+def test_sales_rollups_are_incremental(user, other_user, products):
+    from shop import sales
+    from shop.models import DailyBrandSales, DailyProductSales
+    now = timezone.now()
+    earlier = now - timedelta(days=3)
+    place_order(user, products[0], 2, earlier)
+    place_order(other_user, products[0], 1, earlier)
+    place_order(user, products[1], 4, now - timedelta(days=1))
+    assert sales.refresh(now=now) == (timezone.localdate(earlier), timezone.localdate(now))
+    assert DailyProductSales.objects.get(day=timezone.localdate(earlier), product=products[0]).order_count == 2
+    assert DailyBrandSales.objects.filter(brand=products[0].brand).count() == 2
+
+    def top():
+        return [(row['id'], row['quantity'], row['revenue'], row['order_count'])
+                for row in sales.top_products(timezone.localdate(earlier), timezone.localdate(now))]
+    assert top() == [(products[1].pk, 4, Decimal('41.16'), 1), (products[0].pk, 3, Decimal('30.87'), 2)]
+
+    # A later run re-reads only the days from the high-water mark on.
+    later = now + timedelta(hours=1)
+    place_order(user, products[0], 10, later)
+    old = place_order(user, products[0], 10, earlier)
+    assert sales.refresh(now=later + timedelta(seconds=1)) == (timezone.localdate(now), timezone.localdate(later))
+    assert top()[0] == (products[0].pk, 13, Decimal('133.77'), 3)
+    assert sales.refresh(now=later + timedelta(seconds=2))[0] == timezone.localdate(later)
+    assert top()[0] == (products[0].pk, 13, Decimal('133.77'), 3)
+
+    # Deleting an order sends the next run back to its day; a rebuild catches everything.
+    old.delete()
+    assert sales.refresh(now=later + timedelta(seconds=3))[0] == timezone.localdate(earlier)
+    place_order(user, products[0], 10, earlier)
+    assert top()[0] == (products[0].pk, 13, Decimal('133.77'), 3)
+    sales.refresh(rebuild=True, now=later + timedelta(seconds=4))
+    assert top()[0] == (products[0].pk, 23, Decimal('236.67'), 4)
+    assert [row['id'] for row in sales.top_brands(timezone.localdate(earlier), timezone.localdate(later))] == \
+        [products[0].brand_id]
+
+
+@pytest.mark.django_db
+def test_sales_rollups_outlive_products_and_brands(user, products):
+    from shop import sales
+    from shop.models import DailyBrandSales
+    now = timezone.now()
+    place_order(user, products[0], 2, now - timedelta(days=2))
+    sales.refresh(now=now)
+    brand = products[0].brand
+    Product.objects.filter(pk=products[0].pk).update(name='Renamed')
+    day = timezone.localdate(now - timedelta(days=2))
+    assert [row['name'] for row in sales.top_products(day, day)] == ['Renamed']
+
+    products[0].delete()
+    brand.delete()
+    assert sales.top_products(day, day) == [
+        {'id': None, 'name': 'i', 'quantity': 2, 'revenue': Decimal('20.58'), 'order_count': 1},
+    ]
+    assert DailyBrandSales.objects.get(day=day).name == brand.name
+    assert [row['name'] for row in sales.top_brands(day, day)] == [brand.name]
+
+
+@pytest.mark.django_db
+def test_top_sellers_view(user, superuser, products):
+    place_order(user, products[2], 3, timezone.now())
+    out = StringIO()
+    call_command('rollup_sales', stdout=out)
+    assert 'Rolled up sales from' in out.getvalue()
+    client = Client()
+    url = reverse('top_sellers')
+    today = timezone.localdate().isoformat()
+    client.force_login(user)
+    assert client.get(url, {'date_from': today, 'date_to': today}).status_code == 403
+
+    client.force_login(superuser)
+    report = client.get(url, {'date_from': today, 'date_to': today, 'limit': 5}).json()
+    assert report['results'] == [
+        {'id': products[2].pk, 'name': 'i', 'quantity': 3, 'revenue': '30.87', 'order_count': 1},
+    ]
+    report = client.get(url, {'date_from': today, 'date_to': today, 'by': 'brand'}).json()
+    assert [row['id'] for row in report['results']] == [products[2].brand_id]
+    assert client.get(url, {'date_from': today}).status_code == 400
+    assert client.get(url, {'date_from': today, 'date_to': '2000-01-01'}).status_code == 400
+
+
+@pytest.fixture
+def collected_static(settings, tmp_path):
+    settings.STATIC_ROOT = tmp_path
+    settings.STORAGES = {**settings.STORAGES,
+                         'staticfiles': {'BACKEND': 'shop.staticfiles.CompressedManifestStaticFilesStorage'}}
+    settings.SHOP_BUNDLE_CSS = True
+    call_command('collectstatic', interactive=False, verbosity=0)
+    return tmp_path
+
+
+def test_collectstatic_builds_bundles_and_compressed_copies(collected_static):
+    from shop.staticfiles import hashed_names
+    manifest = json.loads((collected_static / 'staticfiles.json').read_text())['paths']
+    bundle = collected_static / manifest['bundles/product_list.css']
+    parts = [(collected_static / name).read_text().strip() for name in ('base.css', 'product_list.css')]
+    assert bundle.read_text() == '\n'.join(parts) + '\n'
+    assert bundle.read_text().startswith('@import')
+    assert gzip.decompress(Path(f'{bundle}.gz').read_bytes()) == bundle.read_bytes()
+    assert not (collected_static / 'base.css.gz').exists()
+    assert manifest['base.css'] in hashed_names(collected_static)
+
+
+def test_static_files_middleware(collected_static, settings):
+    from shop.middleware import StaticFilesMiddleware
+    settings.SHOP_SERVE_STATIC = True
+    middleware = StaticFilesMiddleware(lambda request: HttpResponse('app'))
+    factory = RequestFactory()
+    name = json.loads((collected_static / 'staticfiles.json').read_text())['paths']['base.css']
+    plain = (collected_static / name).read_bytes()
+
+    response = middleware(factory.get(f'/static/{name}', HTTP_ACCEPT_ENCODING='br;q=0, gzip'))
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.content) == plain
+    assert response['Cache-Control'] == StaticFilesMiddleware.immutable
+    assert response['Vary'] == 'Accept-Encoding'
+    response = middleware(factory.get(f'/static/{name}', HTTP_ACCEPT_ENCODING='gzip;q=0'))
+    assert not response.has_header('Content-Encoding')
+    assert response.content == plain
+    assert response['Content-Type'] == 'text/css; charset=utf-8'
+
+    etag = response['ETag']
+    response = middleware(factory.get(f'/static/{name}', HTTP_IF_NONE_MATCH=etag))
+    assert response.status_code == 304
+    response = middleware(factory.head(f'/static/{name}'))
+    assert response.content == b''
+    assert response['Content-Length'] == str(len(plain))
+
+    assert middleware(factory.get('/static/base.css'))['Cache-Control'] == StaticFilesMiddleware.revalidate
+    assert middleware(factory.get('/static/missing.css')).content == b'app'
+    assert middleware(factory.post(f'/static/{name}')).content == b'app'
+
+    settings.SHOP_SERVE_STATIC = False
+    with pytest.raises(MiddlewareNotUsed):
+        StaticFilesMiddleware(lambda request: None)
+
+
+def test_accepted_encodings():
+    from shop.middleware import accepted_encodings
+    assert accepted_encodings('gzip, deflate, br;q=0.5') == {'gzip', 'deflate', 'br'}
+    assert accepted_encodings('GZIP;q=0, br; q=0.0, *') == {'*'}
+    assert accepted_encodings('') == set()
+
+
+@pytest.mark.django_db
+def test_stylesheets_tag_links_bundle(settings):
+    url = reverse('products_list')
+    client = Client()
+    response = client.get(url)
+    assert b'href="/static/base.css"' in response.content
+    assert b'href="/static/product_list.css"' in response.content
+    settings.SHOP_BUNDLE_CSS = True
+    response = client.get(url)
+    assert b'href="/static/bundles/product_list.css"' in response.content
+    assert b'href="/static/base.css"' not in response.content
+
+
+def test_compression_middleware(settings):
+    from django.http import StreamingHttpResponse
+    from shop.middleware import CompressionMiddleware
+    settings.SHOP_COMPRESS_RESPONSES = True
+    page = b'<tr><td>Rose Noir</td><td>49.90</td></tr>\n' * 100
+    responses = {
+        '/page': lambda: HttpResponse(page, headers={'ETag': '"v1"'}),
+        '/small': lambda: HttpResponse(b'<p>ok</p>'),
+        '/image': lambda: HttpResponse(page, content_type='image/png'),
+        '/encoded': lambda: HttpResponse(page, headers={'Content-Encoding': 'br'}),
+        '/stream': lambda: StreamingHttpResponse(iter([page, b'', page]), content_type='text/csv'),
+    }
+    middleware = CompressionMiddleware(lambda request: responses[request.path]())
+    factory = RequestFactory()
+
+    response = middleware(factory.get('/page', HTTP_ACCEPT_ENCODING='gzip, deflate'))
+    assert response['Content-Encoding'] == 'gzip'
+    assert response['Vary'] == 'Accept-Encoding'
+    assert response['ETag'] == 'W/"v1"'
+    assert gzip.decompress(response.content) == page
+    assert response['Content-Length'] == str(len(response.content))
+    assert response.compression.original == len(page)
+    assert response.compression.compressed == len(response.content)
+
+    response = middleware(factory.get('/page', HTTP_ACCEPT_ENCODING='gzip;q=0, identity'))
+    assert not response.has_header('Content-Encoding')
+    assert response['Vary'] == 'Accept-Encoding'
+    for path in ('/small', '/image', '/encoded'):
+        response = middleware(factory.get(path, HTTP_ACCEPT_ENCODING='gzip'))
+        assert response.content == responses[path]().content
+        assert response.get('Content-Encoding') != 'gzip'
+
+    response = middleware(factory.get('/stream', HTTP_ACCEPT_ENCODING='gzip'))
+    chunks = list(response.streaming_content)
+    assert len(chunks) == 3
+    assert gzip.decompress(b''.join(chunks)) == page * 2
+    assert not response.has_header('Content-Length')
+
+    settings.SHOP_COMPRESS_SKIP_CSRF = True
+    response = HttpResponse(page)
+    response.set_cookie(settings.CSRF_COOKIE_NAME, 'token')
+    middleware = CompressionMiddleware(lambda request: response)
+    assert middleware(factory.get('/', HTTP_ACCEPT_ENCODING='gzip')).content == page
+
+    settings.SHOP_COMPRESS_RESPONSES = False
+    with pytest.raises(MiddlewareNotUsed):
+        CompressionMiddleware(lambda request: None)
+
+
+def test_compression_middleware_async_streaming(settings):
+    from django.http import StreamingHttpResponse
+    from shop.middleware import CompressionMiddleware
+    settings.SHOP_COMPRESS_RESPONSES = True
+
+    async def rows():
+        for number in range(50):
+            yield f'{number},Rose Noir,49.90\n'
+
+    async def view(request):
+        return StreamingHttpResponse(rows(), content_type='text/csv')
+
+    async def fetch():
+        response = await CompressionMiddleware(view)(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        return response, b''.join([chunk async for chunk in response.streaming_content])
+
+    response, body = async_to_sync(fetch)()
+    assert response['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(body).decode() == ''.join(f'{number},Rose Noir,49.90\n' for number in range(50))
+    assert response.compression.original == len(gzip.decompress(body))
+
+
+@pytest.mark.django_db
+def test_brands_list_conditional_get(brands, django_assert_num_queries):
+    client = Client()
+    url = reverse('brands_list')
+    response = client.get(url)
+    assert response['Cache-Control'] == 'private, no-cache'
+    assert not response.has_header('Last-Modified')
+    etag = response['ETag']
+    with django_assert_num_queries(0):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+    assert response['ETag'] == etag
+    # A date alone cannot tell two users' copies apart, so it never earns a 304.
+    assert client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code == 200
+
+    brands[1].delete()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_detail_product_conditional_get(user, products, comments):
+    client = Client()
+    url = reverse('detail_product', args=(products[0].pk,))
+    # The first response sets the CSRF cookie its comment form's token belongs to.
+    first = client.get(url)['ETag']
+    etag = client.get(url, HTTP_IF_NONE_MATCH=first)['ETag']
+    assert etag != first
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    # The page shows who is logged in, so another user never gets a 304 for it.
+    client.force_login(user)
+    user_etag = client.get(url)['ETag']
+    assert user_etag != etag
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+
+    comment = Comment.objects.filter(product=products[0]).first()
+    previous = comment.updated_at
+    comment.text = 'edited'
+    comment.save()
+    assert comment.updated_at > previous
+    response = client.get(url, HTTP_IF_NONE_MATCH=user_etag)
+    assert response.status_code == 200
+    etag = response['ETag']
+    comment.delete()
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 200
+    assert client.get(reverse('detail_product', args=(0,))).status_code == 404
+
+
+@pytest.mark.django_db
+def test_order_detail_conditional_get(create_order, products, django_assert_num_queries):
+    OrderProduct.objects.create(order=create_order, product=products[0], quantity=2,
+                                name=products[0].name, price=products[0].price)
+    create_order.refresh_totals()
+    client = Client()
+    client.force_login(create_order.user)
+    url = reverse('order_detail', args=(create_order.pk,))
+    response = client.get(url)
+    assert not response.has_header('Last-Modified')
+    # The user and the order's validators; nothing is rendered.
+    with django_assert_num_queries(2):
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 304
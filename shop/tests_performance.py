@@ -0,0 +1,201 @@
+import time
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from shop import sales, search
+from shop.models import Brand, Product, Comment, Cart, CartProduct, Order, OrderProduct
+
+BRANDS = 50
+PRODUCTS = 2000
+COMMENTS_PER_PRODUCT = 2
+COMMENTS_ON_POPULAR = 500
+CART_LINES = 50
+ORDERS = 300
+LINES_PER_ORDER = 5
+
+MAX_SECONDS = 1.0
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@pytest.fixture(autouse=True)
+def fast_hashing(settings):
+    settings.PASSWORD_HASHERS = FAST_HASHERS
+
+
+@pytest.fixture(scope='module')
+def catalog(django_db_setup, django_db_blocker):
+    """
+    Seed the large dataset once for the module. Each test still runs in its
+    own rolled-back transaction on top of it; the tables are flushed at the end.
+    """
+    with django_db_blocker.unblock(), override_settings(PASSWORD_HASHERS=FAST_HASHERS):
+        data = seed_catalog()
+    yield data
+    with django_db_blocker.unblock():
+        call_command('flush', interactive=False, verbosity=0)
+        search.rebuild_index()
+
+
+def seed_catalog():
+    user = User.objects.create_user(username='buyer', password='secret-password')
+    superuser = User.objects.create_superuser(username='admin', password='secret-password')
+    commenters = User.objects.bulk_create(User(username=f'commenter{i}') for i in range(20))
+
+    brands = Brand.objects.bulk_create(Brand(name=f'Brand {i}') for i in range(BRANDS))
+    products = Product.objects.bulk_create(
+        Product(
+            name=f'Product {i}',
+            brand=brands[i % BRANDS],
+            price=Decimal(5 + i % 200),
+            for_whom=1 + i % 3,
+            description=f'Description of product {i}',
+        )
+        for i in range(PRODUCTS)
+    )
+    popular = products[0]
+    Comment.objects.bulk_create(
+        Comment(product=product, user=commenters[i % len(commenters)], text=f'comment {i}')
+        for i, product in enumerate(products * COMMENTS_PER_PRODUCT)
+    )
+    Comment.objects.bulk_create(
+        Comment(product=popular, user=commenters[i % len(commenters)], text=f'review {i}')
+        for i in range(COMMENTS_ON_POPULAR)
+    )
+    own_comment = Comment.objects.create(product=popular, user=user, text='mine')
+    Product.objects.refresh_comment_stats()
+
+    cart = Cart.objects.create(user=user)
+    CartProduct.objects.bulk_create(
+        CartProduct(cart=cart, product=product, quantity=2) for product in products[:CART_LINES]
+    )
+    orders = Order.objects.bulk_create(
+        Order(user=user, total_amount=LINES_PER_ORDER * 10, item_count=LINES_PER_ORDER) for _ in range(ORDERS)
+    )
+    OrderProduct.objects.bulk_create(
+        OrderProduct(order=order, product=product, quantity=1, name=product.name, price=product.price)
+        for order in orders
+        for product in products[:LINES_PER_ORDER]
+    )
+    search.rebuild_index()
+    sales.refresh()
+    return {
+        'user': user,
+        'superuser': superuser,
+        'brand': brands[0],
+        'product': popular,
+        'comment': own_comment,
+        'order': orders[0],
+    }
+
+
+# (url name, method, url args, who is logged in, expected status, max queries)
+ROUTES = [
+    ('base', 'get', lambda c: (), None, 200, 0),
+    ('brands_list', 'get', lambda c: (), None, 200, 2),
+    ('add_brand', 'get', lambda c: (), 'superuser', 200, 1),
+    ('add_brand', 'post', lambda c: (), 'superuser', 302, 2),
+    ('update_brand', 'get', lambda c: (c['brand'].pk,), 'superuser', 200, 2),
+    ('update_brand', 'post', lambda c: (c['brand'].pk,), 'superuser', 302, 4),
+    ('delete_brand', 'get', lambda c: (c['brand'].pk,), 'superuser', 200, 2),
+    ('add_product', 'get', lambda c: (), 'superuser', 200, 2),
+    ('add_product', 'post', lambda c: (), 'superuser', 302, 6),
+    ('products_list', 'get', lambda c: (), None, 200, 3),
+    ('detail_product', 'get', lambda c: (c['product'].pk,), None, 200, 3),
+    ('detail_product', 'get', lambda c: (c['product'].pk,), 'user', 200, 4),
+    ('product_comments', 'get', lambda c: (c['product'].pk,), None, 200, 1),
+    ('update_product', 'get', lambda c: (c['product'].pk,), 'superuser', 200, 3),
+    ('update_product', 'post', lambda c: (c['product'].pk,), 'superuser', 302, 7),
+    ('delete_product', 'get', lambda c: (c['product'].pk,), 'superuser', 200, 2),
+    ('add_comment', 'post', lambda c: (c['product'].pk,), 'user', 302, 6),
+    ('update_comment', 'get', lambda c: (c['comment'].pk,), 'user', 200, 4),
+    ('update_comment', 'post', lambda c: (c['comment'].pk,), 'user', 302, 6),
+    ('delete_comment', 'get', lambda c: (c['comment'].pk,), 'user', 200, 4),
+    ('delete_comment', 'post', lambda c: (c['comment'].pk,), 'user', 302, 8),
+    ('add_to_cart', 'post', lambda c: (c['product'].pk,), 'user', 302, 2),
+    ('add_to_cart', 'get', lambda c: (c['product'].pk,), 'user', 302, 1),
+    ('cart', 'get', lambda c: (), 'user', 200, 3),
+    ('delete_from_cart', 'post', lambda c: (c['product'].pk,), 'user', 302, 2),
+    ('create_order', 'post', lambda c: (), 'user', 302, 8),
+    ('order_list', 'get', lambda c: (), 'user', 200, 2),
+    ('order_detail', 'get', lambda c: (c['order'].pk,), 'user', 200, 4),
+    ('delete_order', 'get', lambda c: (c['order'].pk,), 'superuser', 200, 2),
+    ('delete_order', 'post', lambda c: (c['order'].pk,), 'superuser', 302, 5),
+    ('order_export', 'get', lambda c: (), 'superuser', 200, 1),
+    ('top_sellers', 'get', lambda c: (), 'superuser', 200, 3),
+    ('product_search', 'get', lambda c: (), None, 200, 2),
+    ('product_autocomplete', 'get', lambda c: (), None, 200, 2),
+    ('register', 'get', lambda c: (), None, 200, 0),
+    ('register', 'post', lambda c: (), None, 302, 2),
+    ('login', 'get', lambda c: (), None, 200, 0),
+    ('login', 'post', lambda c: (), None, 302, 9),
+    ('logout', 'get', lambda c: (), 'user', 302, 3),
+]
+
+
+def request_data(name, catalog):
+    product = {'name': 'Edited', 'brand': catalog['brand'].pk, 'price': '9.99', 'for_whom': 1,
+               'description': 'text'}
+    return {
+        'add_brand': {'name': 'New brand'},
+        'update_brand': {'name': 'Renamed brand'},
+        'add_product': product,
+        'update_product': product,
+        'add_comment': {'text': 'great'},
+        'update_comment': {'text': 'edited'},
+        'product_search': {'q': 'product 1'},
+        'product_autocomplete': {'q': 'product 1'},
+        'top_sellers': {'date_from': '2000-01-01', 'date_to': '2100-01-01'},
+        'register': {'username': 'newcomer', 'password': 'pw-12345', 'password2': 'pw-12345'},
+        'login': {'username': 'buyer', 'password': 'secret-password'},
+    }.get(name, {})
+
+
+def route_id(route):
+    name, method, _, who, _, _ = route
+    return f'{method}-{name}-{who or "anonymous"}'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name, method, args, who, status, budget', ROUTES, ids=[route_id(r) for r in ROUTES])
+def test_route_query_budget(catalog, django_assert_max_num_queries, name, method, args, who, status, budget):
+    client = Client()
+    if who:
+        client.force_login(catalog[who])
+    url = reverse(name, args=args(catalog))
+    data = request_data(name, catalog)
+
+    start = time.perf_counter()
+    with django_assert_max_num_queries(budget):
+        response = getattr(client, method)(url, data)
+    elapsed = time.perf_counter() - start
+
+    assert response.status_code == status
+    # A login redirect would pass a 302 route without running the view.
+    assert not response.get('Location', '').startswith(reverse('login'))
+    assert elapsed < MAX_SECONDS
+
+
+@pytest.mark.django_db
+def test_order_export_streams_in_chunks(catalog, settings, django_assert_num_queries):
+    settings.SHOP_EXPORT_CHUNK_SIZE = 100
+    client = Client()
+    client.force_login(catalog['superuser'])
+    response = client.get(reverse('order_export'), {'format': 'jsonl'})
+    # One streamed query for the orders plus one line prefetch per chunk.
+    with django_assert_num_queries(1 + ORDERS // 100):
+        lines = b''.join(response.streaming_content).splitlines()
+    assert len(lines) == ORDERS
+
+
+def test_every_named_route_has_a_budget():
+    from accounts.urls import urlpatterns as account_patterns
+    from shop.urls import urlpatterns as shop_patterns
+
+    covered = {route[0] for route in ROUTES}
+    assert {p.name for p in shop_patterns + account_patterns} <= covered
@@ -15,19 +15,32 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 
+from django.conf import settings
 from django.urls import path
 from shop import views
-from shop.views import ProductSearchView
+
+if settings.SHOP_ASYNC_VIEWS:
+    from shop import async_views
+    BrandsListView = async_views.AsyncBrandsListView
+    ProductListView = async_views.AsyncProductListView
+    DetailProductView = async_views.AsyncDetailProductView
+    ProductSearchView = async_views.AsyncProductSearchView
+else:
+    BrandsListView = views.BrandsListView
+    ProductListView = views.ProductListView
+    DetailProductView = views.DetailProductView
+    ProductSearchView = views.ProductSearchView
 
 urlpatterns = [
     path('', views.BaseView.as_view(), name='base'),
     path('add_brand/', views.AddBrandView.as_view(), name='add_brand'),
-    path('brands_list', views.BrandsListView.as_view(), name='brands_list'),
+    path('brands_list', BrandsListView.as_view(), name='brands_list'),
     path('update_brand/<int:pk>/', views.UpdateBrandView.as_view(), name='update_brand'),
     path('delete_brand/<int:pk>', views.DeleteBrandView.as_view(), name='delete_brand'),
     path('add_product/', views.AddProductView.as_view(), name='add_product'),
-    path('products_list/', views.ProductListView.as_view(), name='products_list'),
-    path('detail_product/<int:pk>', views.DetailProductView.as_view(), name='detail_product'),
+    path('products_list/', ProductListView.as_view(), name='products_list'),
+    path('detail_product/<int:pk>', DetailProductView.as_view(), name='detail_product'),
+    path('product_comments/<int:pk>', views.ProductCommentsView.as_view(), name='product_comments'),
     path('update_product/<int:pk>', views.UpdateProductView.as_view(), name='update_product'),
     path('delete_product/<int:pk>', views.DeleteProductView.as_view(), name='delete_product'),
     path('add_comment/<int:product_pk>', views.AddCommentView.as_view(), name='add_comment'),
@@ -40,5 +53,8 @@ urlpatterns = [
     path('order_list/', views.OrderListView.as_view(), name='order_list'),
     path('order_detail/<int:pk>', views.OrderDetailView.as_view(), name='order_detail'),
     path('delete_order/<int:pk>', views.DeleteOrderView.as_view(), name='delete_order'),
+    path('order_export/', views.OrderExportView.as_view(), name='order_export'),
+    path('sales/top_sellers/', views.TopSellersView.as_view(), name='top_sellers'),
     path('product_search/', ProductSearchView.as_view(), name='product_search'),
+    path('product_search/autocomplete', views.ProductAutocompleteView.as_view(), name='product_autocomplete'),
 ]
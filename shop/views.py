@@ -1,11 +1,18 @@
 from django.contrib.auth.mixins import PermissionRequiredMixin, LoginRequiredMixin, UserPassesTestMixin
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse_lazy, reverse
 from django.views import View
 from django.views.generic import CreateView, ListView, DetailView, DeleteView, UpdateView
 
-from shop.forms import AddCommentForm
-from shop.models import Brand, Product, Comment, Cart, CartProduct, Order, OrderProduct
+from shop import autocomplete, catalog_cache, exports, facets, sales
+from shop.conditional import brand_list_validators, conditional, order_validators, product_validators
+from shop.forms import AddCommentForm, OrderExportForm, ProductFilterForm, SalesReportForm
+from shop.models import Brand, Product, Comment, Cart, CartProduct, Order
+from shop.pagination import KeysetPaginationMixin, keyset_paginate
+from shop.search import SearchResults, cached_search_product_ids
 
 
 class AddBrandView(PermissionRequiredMixin, CreateView):
@@ -17,11 +24,25 @@ class AddBrandView(PermissionRequiredMixin, CreateView):
     success_url = reverse_lazy('add_brand')
 
 
+@conditional(brand_list_validators)
 class BrandsListView(ListView):
     model = Brand
     template_name = 'shop/brand_list.html'
     context_object_name = 'brands'
 
+    def get_queryset(self):
+        self.catalog_version = catalog_cache.catalog_version()
+        return catalog_cache.get_or_build(self.cache_key(), lambda: list(Brand.objects.all()))
+
+    def cache_key(self):
+        return catalog_cache.make_key('brands', self.catalog_version)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['catalog_version'] = self.catalog_version
+        context['cache_timeout'] = settings.SHOP_CATALOG_CACHE_TIMEOUT
+        return context
+
 
 class UpdateBrandView(PermissionRequiredMixin, UpdateView):
     permission_required = ['shop.update_brand']
@@ -54,23 +75,146 @@ class AddProductView(PermissionRequiredMixin, CreateView):
     success_url = reverse_lazy('add_product')
 
 
-class ProductListView(ListView):
+class ProductListView(KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'shop/product_list.html'
+    context_object_name = 'product_list'
+    keyset_ordering = ('pk',)
+    sort_orderings = {
+        'popular': ('-comment_count', '-pk'),
+        'recently_discussed': ('-last_comment_at', '-pk'),
+    }
+
+    def get(self, request, *args, **kwargs):
+        self.facets = facets.get_facets()
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = Product.objects.select_related('brand').only('name', 'price', 'brand__name', 'comment_count')
+        if self.request.GET.get('sort') == 'recently_discussed':
+            queryset = queryset.filter(last_comment_at__isnull=False)
+        self.filter_form = ProductFilterForm(self.request.GET, facets=self.facets)
+        return self.filter_form.filter(queryset)
+
+    def get_keyset_ordering(self):
+        return self.sort_orderings.get(self.request.GET.get('sort'), self.keyset_ordering)
+
+    def paginate_queryset(self, queryset, page_size):
+        self.catalog_version, self.listing_version = catalog_cache.listing_versions()
+        return catalog_cache.get_or_build(
+            self.page_cache_key(page_size),
+            lambda: super(ProductListView, self).paginate_queryset(queryset, page_size),
+        )
+
+    def page_cache_key(self, page_size):
+        return catalog_cache.make_key('products', self.catalog_version, self.listing_version, page_size,
+                                      self.request.GET.urlencode())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['product_list'] = Product.objects.all()
+        context['catalog_version'] = self.catalog_version
+        context['cache_timeout'] = settings.SHOP_CATALOG_CACHE_TIMEOUT
+        context['sort'] = self.request.GET.get('sort', '')
+        context['filter_form'] = self.filter_form
+        context['facet_groups'] = self.get_facet_groups()
         return context
 
+    def get_facet_groups(self):
+        """Facet links with their catalog-wide counts; each link toggles its filter."""
+        counts = self.facets
+        return [
+            ('Brand', [self.facet_link('brand', pk, brand['name'], brand['count'])
+                       for pk, brand in counts['brands'].items() if brand['count']]),
+            ('For whom', [self.facet_link('for_whom', value, label, counts['for_whom'].get(value, 0))
+                          for value, label in Product.CHOICES]),
+            ('Price', [self.facet_link('price_band', key, label, counts['price_bands'].get(key, 0), single=True)
+                       for key, label, *_ in facets.price_bands()]),
+        ]
+
+    def facet_link(self, name, value, label, count, single=False):
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        selected = params.getlist(name)
+        value = str(value)
+        active = value in selected
+        if active:
+            selected.remove(value)
+        elif single:
+            selected = [value]
+        else:
+            selected.append(value)
+        params.setlist(name, selected)
+        return {'label': label, 'count': count, 'active': active, 'query': params.urlencode()}
 
+
+@conditional(product_validators)
 class DetailProductView(DetailView):
     model = Product
     template_name = 'shop/product_detail.html'
 
+    def get_object(self, queryset=None):
+        self.catalog_version, self.product_version = catalog_cache.product_versions(self.kwargs['pk'])
+        return catalog_cache.get_or_build(
+            self.object_cache_key(), lambda: super(DetailProductView, self).get_object(queryset)
+        )
+
+    def object_cache_key(self):
+        return catalog_cache.make_key('product', self.kwargs['pk'], self.catalog_version)
+
+    def get_queryset(self):
+        return Product.objects.select_related('brand')
+
+    def get_comments(self):
+        return catalog_cache.get_or_build(self.comments_cache_key(), lambda: keyset_paginate(
+            self.comments_queryset(), ProductCommentsView.keyset_ordering, settings.SHOP_COMMENTS_PAGE_SIZE,
+        ))
+
+    def comments_cache_key(self):
+        return catalog_cache.make_key('comments', self.kwargs['pk'], self.product_version)
+
+    def comments_queryset(self):
+        return Comment.objects.filter(product_id=self.kwargs['pk']).select_related('user')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        page = self.get_comments()
         context['form'] = AddCommentForm()
+        context['comments'] = page.object_list
+        if page.has_next():
+            context['more_comments_url'] = (
+                f"{reverse('product_comments', args=(self.object.pk,))}?after={page.next_cursor}"
+            )
+        context['catalog_version'] = self.catalog_version
+        context['product_version'] = self.product_version
+        context['cache_timeout'] = settings.SHOP_CATALOG_CACHE_TIMEOUT
+        return context
+
+
+class ProductCommentsView(KeysetPaginationMixin, ListView):
+    template_name = 'shop/comment_list.html'
+    context_object_name = 'comments'
+    keyset_ordering = ('-date', '-pk')
+    page_size_setting = 'SHOP_COMMENTS_PAGE_SIZE'
+
+    def get_queryset(self):
+        return Comment.objects.filter(product_id=self.kwargs['pk']).select_related('user')
+
+    def paginate_queryset(self, queryset, page_size):
+        self.product_version = catalog_cache.product_versions(self.kwargs['pk'])[1]
+        key = catalog_cache.make_key('comments', self.kwargs['pk'], self.product_version, page_size,
+                                     self.request.GET.urlencode())
+        return catalog_cache.get_or_build(
+            key, lambda: super(ProductCommentsView, self).paginate_queryset(queryset, page_size)
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context['page_obj']
+        if page.has_next():
+            context['more_comments_url'] = f"{self.request.path}?{page.next_query}"
+        context['product_version'] = self.product_version
+        context['cache_timeout'] = settings.SHOP_CATALOG_CACHE_TIMEOUT
         return context
 
 
@@ -104,7 +248,8 @@ class AddCommentView(LoginRequiredMixin, View):
             comment = form.save(commit=False)
             comment.product = product
             comment.user = request.user
-            comment.save()
+            with transaction.atomic():
+                comment.save()
             return redirect('detail_product', product_pk)
         return render(request, 'shop/product_detail.html', {'form': form})
 
@@ -133,7 +278,11 @@ class DeleteCommentView(UserPassesTestMixin, DeleteView):
     template_name = 'shop/delete_form.html'
 
     def get_success_url(self):
-        return reverse_lazy('detail_product', args=(self.object.product.pk,))
+        return reverse_lazy('detail_product', args=(self.object.product_id,))
+
+    @transaction.atomic
+    def form_valid(self, form):
+        return super().form_valid(form)
 
     def test_func(self):
         comment = self.get_object()
@@ -142,75 +291,56 @@ class DeleteCommentView(UserPassesTestMixin, DeleteView):
 
 class AddProductToCartView(LoginRequiredMixin, View):
     def post(self, request, product_pk):
-        product = Product.objects.get(pk=product_pk)
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        try:
-            cartItem = CartProduct.objects.get(product=product, cart=cart)
-            cartItem.quantity += 1
-            cartItem.save()
-        except CartProduct.DoesNotExist:
-            cart.products.add(product)
+        if not CartProduct.objects.increment(request.user, product_pk):
+            raise Http404('No product found matching the query')
         return redirect('products_list')
 
     def get(self, request, product_pk):
-        if not request.user.is_authenticated:
-            request.session['next_url'] = request.path
-            return redirect('login')
-        next_url = request.session.pop('next_url', None)
-        if next_url:
-            return redirect(next_url)
-        else:
-            return redirect('products_list')
+        # LoginRequiredMixin already sent anonymous users to the login page with ?next=.
+        return redirect('products_list')
 
 
 class ShowCartView(LoginRequiredMixin, View):
     def get(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        return render(request, 'shop/cart.html', {'cart': cart})
+        cart = Cart.objects.with_total().filter(user=request.user).first()
+        if cart is None:
+            cart = Cart.objects.create(user=request.user)
+        items = cart.cartproduct_set.with_totals().order_by('pk')
+        return render(request, 'shop/cart.html', {'cart': cart, 'items': items})
 
 
 class DeleteProductFromCartView(LoginRequiredMixin, View):
     def post(self, request, product_pk):
-        product = Product.objects.get(pk=product_pk)
-        cart = Cart.objects.get(user=request.user)
-        try:
-            cartItem = CartProduct.objects.get(product=product, cart=cart)
-            if cartItem.quantity == 1:
-                cartItem.delete()
-            else:
-                cartItem.quantity -= 1
-                cartItem.save()
-        except CartProduct.DoesNotExist:
-            pass
+        CartProduct.objects.decrement(request.user, product_pk)
         return redirect('cart')
 
 
 class CreateOrderView(LoginRequiredMixin, View):
     def post(self, request):
-        cart, created = Cart.objects.get_or_create(user=request.user)
-        if created or not cart.cartproduct_set.all():
+        if Order.objects.create_from_cart(request.user) is None:
             return redirect('cart')
-        order = Order.objects.create(user=request.user)
-        for cart_product in cart.cartproduct_set.all():
-            OrderProduct.objects.create(product=cart_product.product,
-                                        order=order,
-                                        quantity=cart_product.quantity)
-        cart.cartproduct_set.all().delete()
         return redirect('order_list')
 
 
-class OrderListView(LoginRequiredMixin, ListView):
+class OrderListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Order
     template_name = 'shop/order_list.html'
+    keyset_ordering = ('-date', '-pk')
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(user=self.request.user).only('user', 'date', 'total_amount', 'item_count')
 
 
+@conditional(order_validators)
 class OrderDetailView(LoginRequiredMixin, DetailView):
     model = Order
     template_name = 'shop/order_detail.html'
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['items'] = self.object.orderproduct_set.with_totals().order_by('pk')
+        return context
+
 
 class DeleteOrderView(PermissionRequiredMixin, DeleteView):
     permission_required = ['shop.delete_order']
@@ -223,6 +353,46 @@ class DeleteOrderView(PermissionRequiredMixin, DeleteView):
         return reverse_lazy('order_list')
 
 
+class OrderExportView(UserPassesTestMixin, View):
+    """Staff download of orders and their lines, streamed as CSV or JSON lines."""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        form = OrderExportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        data = form.cleaned_data
+        orders = exports.orders_for_export(data['date_from'], data['date_to'], data['user'])
+        response = StreamingHttpResponse(exports.export(data['format'], orders),
+                                         content_type=exports.CONTENT_TYPES[data['format']])
+        response['Content-Disposition'] = f'attachment; filename="orders.{data["format"]}"'
+        return response
+
+
+class TopSellersView(UserPassesTestMixin, View):
+    """Staff report of the best sellers by revenue, read from the daily sales rollups."""
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        form = SalesReportForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        data = form.cleaned_data
+        top = sales.top_products if data['by'] == 'product' else sales.top_brands
+        rows = top(data['date_from'], data['date_to'], data['limit'])
+        return JsonResponse({
+            'by': data['by'],
+            'date_from': data['date_from'],
+            'date_to': data['date_to'],
+            'rolled_up_to': sales.rolled_up_to(),
+            'results': [{**row, 'revenue': str(row['revenue'])} for row in rows],
+        })
+
+
 class ProductSearchView(ListView):
     model = Product
     template_name = 'shop/product_search.html'
@@ -232,11 +402,25 @@ class ProductSearchView(ListView):
     def get_queryset(self):
         query = self.request.GET.get('q')
         if query:
-            return Product.objects.filter(name__icontains=query)
+            return SearchResults(cached_search_product_ids(query), self.products_queryset())
         else:
             return Product.objects.none()
 
+    def products_queryset(self):
+        return Product.objects.only('name', 'price')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.request.GET.get('q', '')
+        return context
+
 
 class BaseView(View):
     def get(self, request):
         return render(request, 'base.html')
+
+
+class ProductAutocompleteView(View):
+    def get(self, request):
+        query = request.GET.get('q', '')
+        return JsonResponse({'query': query, 'suggestions': autocomplete.suggest(query)})